@@ -0,0 +1,99 @@
+"""
+列表端點的吞吐量測試
+
+用法 (需先啟動 Backend)：
+    python benchmark.py --seed 5000                  # 寫入測試資料到 DATABASE_URL (請使用測試用資料庫)
+    python benchmark.py --url http://localhost:8000 --limit 1000 --requests 50
+
+對每個端點依序發出 --requests 次請求，輸出每秒請求數、延遲中位數與每秒輸出筆數。
+"""
+import os
+import json
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CITIES = [
+    '基隆市', '臺北市', '新北市', '桃園市', '新竹市', '新竹縣', '苗栗縣', '臺中市',
+    '彰化縣', '南投縣', '雲林縣', '嘉義市', '嘉義縣', '臺南市', '高雄市', '屏東縣',
+    '宜蘭縣', '花蓮縣', '臺東縣', '澎湖縣', '金門縣', '連江縣'
+]
+
+def seed(count: int):
+    """寫入 count 筆特報 / 地震 / 預報 (內容長度接近實際資料)"""
+    from database import SessionLocal
+    import models
+
+    db = SessionLocal()
+    now = datetime.now(timezone.utc)
+    text = "氣象署發布大雨特報，受鋒面影響，今日各地有局部大雨發生的機率，請注意雷擊及強陣風。" * 8
+    try:
+        for i in range(count):
+            created = now - timedelta(minutes=i * 10)
+            cities = [{"name": c, "wx": "多雲短暫陣雨", "pop": str(random.randint(0, 100)),
+                       "minT": str(random.randint(15, 22)), "maxT": str(random.randint(23, 32))} for c in CITIES]
+            db.add(models.WeatherWarning(
+                dataset_id="W-C0033-002", issue_time=created.isoformat(), title=f"大雨特報 #{i}",
+                content=text, affected_areas=", ".join(CITIES[:8]), ai_report=text, is_reported=True,
+                created_at=created
+            ))
+            db.add(models.EarthquakeAlert(
+                earthquake_no=900000 + i, report_type="地震報告", origin_time=created.isoformat(),
+                location="花蓮縣政府東南方 20.0 公里 (位於臺灣東部海域)", magnitude="4.8", depth="15",
+                content=text, intensity_summary="花蓮縣4級, 宜蘭縣3級, 臺北市2級", ai_report=text,
+                is_reported=True, created_at=created
+            ))
+            db.add(models.WeatherForecast(
+                overview="", cities_data=json.dumps(cities, ensure_ascii=False), ai_report=text, created_at=created
+            ))
+            if i % 500 == 499:
+                db.commit()
+        db.commit()
+        print(f"Seeded {count} rows per table")
+    finally:
+        db.close()
+
+def run(url: str, limit: int, requests: int):
+    endpoints = [
+        f"/api/warnings?limit={limit}",
+        f"/api/earthquakes?limit={limit}",
+        f"/api/forecasts?limit={limit}",
+        "/api/weather",
+    ]
+    with httpx.Client(base_url=url, timeout=60.0) as client:
+        print(f"{'endpoint':<32}{'req/s':>10}{'p50 ms':>10}{'rows/s':>12}{'KB/resp':>10}")
+        for path in endpoints:
+            client.get(path).raise_for_status() # warm up
+            latencies = []
+            rows = size = 0
+            for _ in range(requests):
+                started = time.perf_counter()
+                resp = client.get(path)
+                latencies.append(time.perf_counter() - started)
+                resp.raise_for_status()
+                data = resp.json()
+                rows += len(data) if isinstance(data, list) else 1
+                size += len(resp.content)
+            total = sum(latencies)
+            print(f"{path.split('?')[0]:<32}{requests / total:>10.1f}{statistics.median(latencies) * 1000:>10.1f}"
+                  f"{rows / total:>12.0f}{size / requests / 1024:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("BACKEND_BASE_URL", "http://localhost:8000"))
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0, help="寫入測試資料的筆數 (每張表)")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.seed)
+    else:
+        run(args.url, args.limit, args.requests)
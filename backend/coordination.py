@@ -0,0 +1,329 @@
+"""
+多個 Backend replica 之間的協調
+
+- Leader election：以 leader_leases 資料表做租約 (lease)，持有租約的 replica 才會執行
+  資料抓取、AI 生成、TTS 與批次工作；其他 replica (follower) 只負責讀取 API，
+  收到需要 leader 的請求時會轉送給目前的 leader。
+- 快取失效：leader commit 時透過 PostgreSQL NOTIFY 廣播，所有 replica 以 LISTEN 接收並清除本地快取。
+
+非 PostgreSQL 的資料庫 (單機開發) 一律視為 leader，也不會啟動 LISTEN。
+"""
+import os
+import re
+import time
+import select
+import socket
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+import httpx
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from database import engine
+
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# 其他 replica 轉送請求給本機時使用的位址
+INSTANCE_URL = os.getenv("INSTANCE_URL") or f"http://{socket.gethostname()}:{os.getenv('PORT', '8000')}"
+
+LEADER_LEASE_NAME = "weather-backend"
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "8"))
+LEADER_RENEW_SECONDS = float(os.getenv("LEADER_RENEW_SECONDS", "2"))
+# 自上次成功續約起超過此秒數即不再視為 leader (早於 DB 上的租約到期，其他 replica 接手時本機已卸任)
+LEADER_VALID_SECONDS = LEADER_LEASE_SECONDS - LEADER_RENEW_SECONDS
+# 單次續約的等待上限：DB 卡住時不能讓 is_leader 一直停在 True
+LEADER_RENEW_TIMEOUT = LEADER_VALID_SECONDS / 2
+
+NOTIFY_CHANNEL = "weather_updates"
+FORWARDED_HEADER = "x-forwarded-by-replica"
+
+logger = logging.getLogger(__name__)
+
+# 只有 leader 能處理的請求 (method, path regex)
+LEADER_ONLY_ROUTES = [
+    ("POST", re.compile(r"^/api/cron/")),
+    ("POST", re.compile(r"^/api/weather/(broadcast|prepare|publish)$")),
+    ("POST", re.compile(r"^/api/(warnings|earthquakes)/\d+/re-report$")),
+    ("POST", re.compile(r"^/api/regenerate")),
+    # cron 的 profile 保存在執行 cron 的 leader 上
+    ("GET", re.compile(r"^/debug/profiles")),
+    ("DELETE", re.compile(r"^/debug/profiles$")),
+]
+
+def _coordination_enabled() -> bool:
+    return engine.dialect.name == "postgresql"
+
+class LeaderElector:
+    """定期取得 / 續約 leader 租約"""
+
+    def __init__(self):
+        self._standalone = not _coordination_enabled()
+        self._is_leader = self._standalone
+        self.leader_id: Optional[str] = INSTANCE_ID if self._standalone else None
+        self.leader_url: Optional[str] = INSTANCE_URL if self._standalone else None
+        self._renewed_at = 0.0 # 最後一次成功續約的請求「送出」時間 (monotonic)
+        self._pending: Optional[asyncio.Future] = None # 尚未結束的續約 (逾時後 thread 仍可能在執行)
+        self._task: Optional[asyncio.Task] = None
+        self._on_elected: List[Callable] = []
+        self._on_demoted: List[Callable] = []
+
+    @property
+    def is_leader(self) -> bool:
+        """
+        租約有時效：即使續約迴圈卡住，自上次成功續約起超過 LEADER_VALID_SECONDS 也不再是 leader
+        """
+        if self._standalone:
+            return True
+        return self._is_leader and time.monotonic() - self._renewed_at < LEADER_VALID_SECONDS
+
+    def on_elected(self, callback: Callable):
+        self._on_elected.append(callback)
+
+    def on_demoted(self, callback: Callable):
+        self._on_demoted.append(callback)
+
+    def _acquire(self):
+        """嘗試取得或續約租約，回傳目前的 (holder, holder_url)"""
+        with engine.begin() as conn:
+            timeout_ms = int(LEADER_RENEW_TIMEOUT * 1000)
+            conn.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+            conn.execute(text(f"SET LOCAL lock_timeout = {timeout_ms}"))
+            row = conn.execute(text("""
+                INSERT INTO leader_leases (name, holder, holder_url, expires_at, renewed_at)
+                VALUES (:name, :holder, :url, now() + make_interval(secs => :ttl), now())
+                ON CONFLICT (name) DO UPDATE
+                SET holder = EXCLUDED.holder, holder_url = EXCLUDED.holder_url,
+                    expires_at = EXCLUDED.expires_at, renewed_at = EXCLUDED.renewed_at
+                WHERE leader_leases.holder = EXCLUDED.holder OR leader_leases.expires_at < now()
+                RETURNING holder, holder_url
+            """), {"name": LEADER_LEASE_NAME, "holder": INSTANCE_ID, "url": INSTANCE_URL, "ttl": LEADER_LEASE_SECONDS}).first()
+            if row is None:
+                row = conn.execute(text(
+                    "SELECT holder, holder_url FROM leader_leases WHERE name = :name"
+                ), {"name": LEADER_LEASE_NAME}).first()
+            return row.holder, row.holder_url
+
+    async def _set_leader(self, is_leader: bool):
+        if is_leader == self._is_leader:
+            return
+        self._is_leader = is_leader
+        logger.info("Elected as leader" if is_leader else "Stepped down as leader", extra={"instance": INSTANCE_ID})
+        await self._run_callbacks(self._on_elected if is_leader else self._on_demoted)
+
+    async def _run_callbacks(self, callbacks: List[Callable]):
+        for callback in callbacks:
+            try:
+                result = callback()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                logger.exception("Leader callback error")
+
+    async def _renew(self):
+        """續約一次；等待超過 LEADER_RENEW_TIMEOUT 視為失敗"""
+        if self._pending is not None and not self._pending.done():
+            # 上一次的續約仍卡在 thread 中，不再堆疊新的 thread
+            raise TimeoutError("previous lease renewal still running")
+        # 以送出時間計算租約時效：DB 上的 expires_at 一定晚於此時間 + LEADER_LEASE_SECONDS
+        started = time.monotonic()
+        self._pending = asyncio.ensure_future(asyncio.to_thread(self._acquire))
+        holder, holder_url = await asyncio.wait_for(asyncio.shield(self._pending), LEADER_RENEW_TIMEOUT)
+        self.leader_id, self.leader_url = holder, holder_url
+        if holder == INSTANCE_ID:
+            self._renewed_at = started
+        await self._set_leader(holder == INSTANCE_ID)
+
+    async def _run(self):
+        while True:
+            try:
+                await self._renew()
+            except Exception as e:
+                logger.warning("Leader lease renewal failed: %s", str(e) or type(e).__name__, extra={"instance": INSTANCE_ID})
+            # 無法續約時，在租約到期前先卸任 (is_leader 已依時效回傳 False，這裡觸發卸任的 callback)
+            if self._is_leader and not self.is_leader:
+                self.leader_id = self.leader_url = None
+                await self._set_leader(False)
+            await asyncio.sleep(LEADER_RENEW_SECONDS)
+
+    async def start(self):
+        if not _coordination_enabled():
+            # 單機模式一律是 leader
+            await self._run_callbacks(self._on_elected)
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """關閉時主動釋出租約，讓其他 replica 立即接手"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        if self._is_leader:
+            await self._set_leader(False)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        "DELETE FROM leader_leases WHERE name = :name AND holder = :holder"
+                    ), {"name": LEADER_LEASE_NAME, "holder": INSTANCE_ID})
+            except Exception as e:
+                logger.warning("Failed to release leader lease: %s", e, extra={"instance": INSTANCE_ID})
+
+    def status(self) -> dict:
+        return {
+            "instance_id": INSTANCE_ID,
+            "instance_url": INSTANCE_URL,
+            "is_leader": self.is_leader,
+            "leader_id": self.leader_id,
+            "leader_url": self.leader_url,
+        }
+
+elector = LeaderElector()
+
+class NotLeaderError(Exception):
+    """執行途中已不是 leader (租約過期或已交接)，不可再播報或寫入"""
+
+def ensure_leader():
+    """
+    在 TTS 與 commit 之前呼叫：middleware 只在請求開始時檢查 leader，
+    執行較久的 cron / 播報 / 重新生成途中可能已交接，此時中止，交給新的 leader
+    """
+    if not elector.is_leader:
+        raise NotLeaderError("本機已不是 leader")
+
+async def not_leader_handler(request, exc: NotLeaderError):
+    """中止的請求回 503，呼叫端 (排程器) 下一次呼叫時會轉送給新的 leader"""
+    logger.warning("Lost leadership during request, aborted", extra={"path": request.url.path})
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "本機已不是 leader，請稍後再試"},
+        headers={"Retry-After": str(int(LEADER_LEASE_SECONDS))}
+    )
+
+# --- 轉送需要 leader 的請求 ---
+
+def requires_leader(request) -> bool:
+    # GET /api/weather?refresh=true 會抓取資料並呼叫 AI 生成
+    if request.method == "GET" and request.url.path == "/api/weather" and request.query_params.get("refresh") in ("true", "1"):
+        return True
+    return any(request.method == method and pattern.match(request.url.path) for method, pattern in LEADER_ONLY_ROUTES)
+
+class LeaderRoutingMiddleware(BaseHTTPMiddleware):
+    """follower 收到需要 leader 的請求時，轉送給目前的 leader 並回傳其結果"""
+
+    async def dispatch(self, request, call_next):
+        if elector.is_leader or not requires_leader(request):
+            return await call_next(request)
+
+        if not elector.leader_url or request.headers.get(FORWARDED_HEADER):
+            # 尚未選出 leader，或 leader 剛好交接 (避免來回轉送)
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "目前沒有可用的 leader，請稍後再試"},
+                headers={"Retry-After": str(int(LEADER_LEASE_SECONDS))}
+            )
+
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+        headers[FORWARDED_HEADER] = INSTANCE_ID
+        url = f"{elector.leader_url}{request.url.path}"
+        if request.url.query:
+            url += f"?{request.url.query}"
+        try:
+            async with httpx.AsyncClient(timeout=600.0) as client:
+                resp = await client.request(request.method, url, headers=headers, content=await request.body())
+        except httpx.HTTPError as e:
+            logger.error("Forwarding to leader failed: %s", e, extra={"leader": elector.leader_id, "path": request.url.path})
+            return JSONResponse(status_code=503, content={"detail": "無法連線至 leader"})
+
+        excluded = ("content-length", "content-encoding", "transfer-encoding", "connection")
+        return Response(
+            content=resp.content,
+            status_code=resp.status_code,
+            headers={k: v for k, v in resp.headers.items() if k.lower() not in excluded}
+        )
+
+# --- 快取失效 (LISTEN / NOTIFY) ---
+
+_invalidate_callbacks: Dict[str, List[Callable[[], None]]] = {}
+
+def on_invalidate(topic: str, callback: Callable[[], None]):
+    """註冊快取失效的 callback，topic 為 forecasts / warnings / earthquakes"""
+    _invalidate_callbacks.setdefault(topic, []).append(callback)
+
+def _dispatch(topic: str):
+    for callback in _invalidate_callbacks.get(topic, []):
+        try:
+            callback()
+        except Exception:
+            logger.exception("Cache invalidation callback error", extra={"topic": topic})
+
+def notify(db: Session, topic: str):
+    """
+    在目前的 transaction 中送出 NOTIFY，PostgreSQL 會在 commit 後才送達，
+    因此呼叫端應在 db.commit() 之前呼叫。
+    """
+    if _coordination_enabled():
+        db.execute(text("SELECT pg_notify(:channel, :topic)"), {"channel": NOTIFY_CHANNEL, "topic": topic})
+    else:
+        _dispatch(topic)
+
+class CacheInvalidationListener:
+    """背景執行緒：以獨立連線 LISTEN，收到通知後執行對應的 callback"""
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._connected = threading.Event()
+
+    def _listen(self):
+        backoff = 1.0
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = engine.raw_connection()
+                dbapi_conn = conn.dbapi_connection
+                dbapi_conn.autocommit = True
+                with dbapi_conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # 重新連線期間可能漏掉通知，全部清除一次
+                for topic in list(_invalidate_callbacks):
+                    _dispatch(topic)
+                self._connected.set()
+                backoff = 1.0
+
+                while not self._stopped.is_set():
+                    if select.select([dbapi_conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    dbapi_conn.poll()
+                    while dbapi_conn.notifies:
+                        _dispatch(dbapi_conn.notifies.pop(0).payload)
+            except Exception as e:
+                self._connected.clear()
+                logger.warning("Cache invalidation listener error: %s, reconnecting in %.0fs", e, backoff)
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.invalidate()
+                    except Exception:
+                        pass
+
+    def start(self):
+        if not _coordination_enabled():
+            return
+        self._thread = threading.Thread(target=self._listen, name="cache-invalidation-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._connected.clear()
+
+    def healthy(self) -> bool:
+        """是否能可靠收到失效通知 (本地快取可以使用)"""
+        return not _coordination_enabled() or self._connected.is_set()
+
+listener = CacheInvalidationListener()
@@ -0,0 +1,279 @@
+"""
+中央氣象署 (CWA) 開放資料的統一出口
+
+所有 datastore 請求都經過 fetch()：
+- 全域 token bucket (CWA_RATE_PER_MINUTE / CWA_BURST)，最後 CWA_EQ_RESERVE 個 token 只給地震 (E-A0015-001)，
+  儀表板的大量查詢不會吃掉地震輪詢的額度
+- 相同資料集 + 參數的同時請求只會打一次 CWA (request coalescing)
+- 每次成功的回應寫入 CWA_CACHE_DIR (last-good)；CWA 失敗或 token 不足時回傳 last-good；
+  縣市預報另外在超過 CWA_SLOW_SECONDS 未回應時先回傳 last-good，背景繼續更新 (stale-while-revalidate)。
+  地震 / 特報不因緩慢而回傳舊資料 (舊快照會讓新事件延到下一次輪詢才播報)；沒有 last-good 時才拋出 CWAError
+- 依資料集統計請求 / 快取 / token 用量，由 GET /api/cwa/metrics 查看
+
+token bucket 與統計以 process 為單位 (只在 event loop 中使用，不需 lock)；多個 replica 時各自計算，
+cron 只在 leader 執行，follower 只有公開的縣市查詢會用到。
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import httpx
+from fastapi import APIRouter
+
+CWA_API_KEY = os.getenv("CWA_API_KEY")
+DATASTORE_URL = "https://opendata.cwa.gov.tw/api/v1/rest/datastore"
+
+CWA_RATE_PER_MINUTE = float(os.getenv("CWA_RATE_PER_MINUTE", "30"))
+CWA_BURST = int(os.getenv("CWA_BURST", "20"))
+CWA_EQ_RESERVE = int(os.getenv("CWA_EQ_RESERVE", "5")) # 只有地震能用的 token 數
+CWA_MAX_WAIT = float(os.getenv("CWA_MAX_WAIT", "10")) # 等待 token 的上限 (秒)
+CWA_SLOW_SECONDS = float(os.getenv("CWA_SLOW_SECONDS", "3")) # 超過此秒數且有 last-good 時先回傳舊資料
+CWA_TIMEOUT = float(os.getenv("CWA_TIMEOUT", "10"))
+CWA_CACHE_DIR = os.getenv("CWA_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "cwa_cache")
+CWA_FORECAST_MAX_AGE = float(os.getenv("CWA_FORECAST_MAX_AGE", "60")) # 縣市預報在此秒數內直接使用上次結果
+
+FORECAST = "F-C0032-001"
+WARNINGS = "W-C0033-002"
+EARTHQUAKES = "E-A0015-001"
+
+# max_age：在此秒數內的結果直接使用，不打 CWA；reserved：可使用保留給地震的 token；
+# slow_seconds：CWA 超過此秒數未回應時先回傳 last-good，None 為等待 CWA 回應 (只在失敗 / 限流時才用 last-good)
+DATASETS = {
+    FORECAST: {"max_age": CWA_FORECAST_MAX_AGE, "reserved": False, "slow_seconds": CWA_SLOW_SECONDS},
+    WARNINGS: {"max_age": 0, "reserved": False, "slow_seconds": None},
+    EARTHQUAKES: {"max_age": 0, "reserved": True, "slow_seconds": None},
+}
+DEFAULT_DATASET = {"max_age": 0, "reserved": False, "slow_seconds": None}
+
+logger = logging.getLogger(__name__)
+
+class CWAError(Exception):
+    """CWA 無法取得資料，且沒有可用的 last-good"""
+
+class TokenBucket:
+    """每分鐘補充 rate 個 token，最多 capacity 個；一般請求不能用到最後 reserve 個"""
+
+    def __init__(self, rate_per_minute: float, capacity: int, reserve: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.reserve = min(reserve, capacity - 1)
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, reserved: bool = False) -> float:
+        """取得一個 token 時回傳 0，否則回傳需要等待的秒數"""
+        self._refill()
+        floor = 0 if reserved else self.reserve
+        if self.tokens - 1 >= floor:
+            self.tokens -= 1
+            return 0.0
+        return (floor + 1 - self.tokens) / self.rate
+
+    async def acquire(self, reserved: bool, max_wait: float) -> bool:
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire(reserved)
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def snapshot(self) -> dict:
+        self._refill()
+        return {
+            "tokens": round(self.tokens, 2), "capacity": self.capacity,
+            "reserve": self.reserve, "rate_per_minute": self.rate * 60,
+        }
+
+bucket = TokenBucket(CWA_RATE_PER_MINUTE, CWA_BURST, CWA_EQ_RESERVE)
+
+_client: Optional[httpx.AsyncClient] = None
+_last_good: Dict[str, dict] = {} # cache key -> {"fetched_at", "data"}
+_disk_checked = set() # 已嘗試從磁碟載入 last-good 的 cache key
+_inflight: Dict[str, asyncio.Task] = {}
+_stats: Dict[str, dict] = {}
+_usage: Dict[str, deque] = {} # 資料集 -> 最近一小時打 CWA 的時間
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+def _dataset_stats(dataset: str) -> dict:
+    if dataset not in _stats:
+        _stats[dataset] = {
+            "requests": 0, "upstream": 0, "fresh_hits": 0, "coalesced": 0, "stale_served": 0,
+            "throttled": 0, "errors": 0, "last_success": None, "last_error": None, "last_latency_ms": None,
+        }
+        _usage[dataset] = deque()
+    return _stats[dataset]
+
+def _get_client() -> httpx.AsyncClient:
+    # 共用連線 (與 TLS 設定)，不必每次請求重新建立
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=CWA_TIMEOUT)
+    return _client
+
+async def close():
+    if _client is not None:
+        await _client.aclose()
+
+def _cache_key(dataset: str, params: Optional[dict]) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+    return f"{dataset}?{query}"
+
+def _cache_path(dataset: str, key: str) -> str:
+    return os.path.join(CWA_CACHE_DIR, f"{dataset}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}.json")
+
+def _read_last_good(dataset: str, key: str) -> Optional[dict]:
+    try:
+        with open(_cache_path(dataset, key), encoding="utf-8") as f:
+            entry = json.load(f)
+        return {"fetched_at": entry["fetched_at"], "data": entry["data"]}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Unreadable CWA cache file: %s", e, extra={"dataset": dataset})
+        return None
+
+def _write_last_good(dataset: str, key: str, entry: dict):
+    """寫入暫存檔後再 rename，讀取端不會看到寫一半的檔案"""
+    path = _cache_path(dataset, key)
+    try:
+        os.makedirs(CWA_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key, **entry}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Failed to write CWA cache file: %s", e, extra={"dataset": dataset})
+
+async def _get_last_good(dataset: str, key: str) -> Optional[dict]:
+    if key not in _last_good and key not in _disk_checked:
+        _disk_checked.add(key)
+        entry = await asyncio.to_thread(_read_last_good, dataset, key)
+        if entry is not None:
+            _last_good.setdefault(key, entry)
+    return _last_good.get(key)
+
+def _describe(e: Exception) -> str:
+    # 不輸出 httpx 錯誤中的完整 URL (含 API Key)
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"HTTP {e.response.status_code}"
+    return f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+
+async def _revalidate(dataset: str, key: str, params: Optional[dict], reserved: bool) -> Optional[dict]:
+    """打一次 CWA 並更新 last-good；失敗或拿不到 token 時回傳 None (不拋出例外，背景執行時也不會遺失錯誤)"""
+    stats = _dataset_stats(dataset)
+    if not await bucket.acquire(reserved, CWA_MAX_WAIT):
+        stats["throttled"] += 1
+        logger.warning("CWA request throttled", extra={"dataset": dataset, "tokens": round(bucket.tokens, 2)})
+        return None
+
+    stats["upstream"] += 1
+    _usage[dataset].append(time.time())
+    started = time.perf_counter()
+    try:
+        resp = await _get_client().get(
+            f"{DATASTORE_URL}/{dataset}", params={"Authorization": CWA_API_KEY, "format": "JSON", **(params or {})}
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        if str(data.get("success", "true")).lower() == "false":
+            raise ValueError(data.get("message") or "CWA 回應 success=false")
+    except (httpx.HTTPError, ValueError) as e:
+        stats["errors"] += 1
+        stats["last_error"] = {"at": _now_iso(), "error": _describe(e)}
+        logger.warning("CWA request failed: %s", _describe(e), extra={
+            "dataset": dataset, "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+        return None
+
+    stats["last_latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    stats["last_success"] = _now_iso()
+    entry = {"fetched_at": time.time(), "data": data}
+    _last_good[key] = entry
+    await asyncio.to_thread(_write_last_good, dataset, key, entry)
+    return data
+
+def _forget_inflight(key: str, task: asyncio.Task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+
+async def fetch(dataset: str, params: Optional[dict] = None) -> dict:
+    """
+    取得 CWA datastore 資料集 (回傳解析後的 JSON)。
+    CWA 緩慢 / 失敗 / token 不足時回傳 last-good；完全沒有資料時拋出 CWAError。
+    """
+    if not CWA_API_KEY:
+        raise CWAError("未設定 CWA API Key")
+
+    config = DATASETS.get(dataset, DEFAULT_DATASET)
+    key = _cache_key(dataset, params)
+    stats = _dataset_stats(dataset)
+    stats["requests"] += 1
+
+    last_good = await _get_last_good(dataset, key)
+    if last_good and config["max_age"] and time.time() - last_good["fetched_at"] < config["max_age"]:
+        stats["fresh_hits"] += 1
+        return last_good["data"]
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_revalidate(dataset, key, params, config["reserved"]))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _forget_inflight(key, t))
+    else:
+        stats["coalesced"] += 1
+
+    # shield：呼叫端被取消 (例如 client 斷線) 時，其他等待同一請求的呼叫端不受影響
+    if last_good is None or config["slow_seconds"] is None:
+        data = await asyncio.shield(task)
+    else:
+        done, _ = await asyncio.wait({task}, timeout=config["slow_seconds"])
+        data = task.result() if done else None
+
+    if data is not None:
+        return data
+    if last_good is None:
+        raise CWAError(f"無法取得 CWA 資料 ({dataset})")
+
+    stats["stale_served"] += 1
+    logger.warning("Serving stale CWA data", extra={
+        "dataset": dataset, "age_s": round(time.time() - last_good["fetched_at"]), "revalidating": not task.done()
+    })
+    return last_good["data"]
+
+def metrics() -> dict:
+    cutoff = time.time() - 3600
+    datasets = {}
+    for dataset, stats in _stats.items():
+        usage = _usage[dataset]
+        while usage and usage[0] < cutoff:
+            usage.popleft()
+        ages = [time.time() - e["fetched_at"] for k, e in _last_good.items() if k.startswith(f"{dataset}?")]
+        datasets[dataset] = {
+            **stats,
+            "upstream_last_hour": len(usage),
+            "last_good_age_s": round(min(ages)) if ages else None,
+        }
+    return {"bucket": bucket.snapshot(), "inflight": len(_inflight), "datasets": datasets}
+
+router = APIRouter()
+
+@router.get("/api/cwa/metrics")
+async def get_metrics():
+    """各資料集的 CWA 請求量 (本 replica)；async 以便在 event loop 中讀取統計"""
+    return metrics()
@@ -5,7 +5,12 @@ import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://weather_user:weather_password@db:5432/weather_db")
 
-engine = create_engine(DATABASE_URL)
+# 連線逾時 (秒)：資料庫無回應時不讓 leader 續約等呼叫無限期卡住
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+# session 時區固定為 UTC：時間欄位一律以 UTC 讀出，orjson 輸出為 "Z" (與儀表板 SQL 的格式一致)
+connect_args = {"connect_timeout": DB_CONNECT_TIMEOUT, "options": "-c timezone=UTC"} if DATABASE_URL.startswith("postgresql") else {}
+
+engine = create_engine(DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
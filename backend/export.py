@@ -0,0 +1,185 @@
+"""
+大量匯出 API：/api/export/{warnings|earthquakes|forecasts}
+
+以 server-side cursor (stream_results + yield_per) 逐批讀取並直接串流輸出，
+後端記憶體用量只與批次大小有關，與匯出的總筆數無關。
+支援 NDJSON / CSV / Parquet (需安裝 pyarrow)，並可用 start / end 日期篩選 created_at。
+"""
+import io
+import os
+import csv
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, Boolean, DateTime, Integer
+
+from database import SessionLocal
+import models
+import retention
+
+router = APIRouter()
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+logger = logging.getLogger(__name__)
+
+EXPORT_MODELS = {
+    "warnings": models.WeatherWarning,
+    "earthquakes": models.EarthquakeAlert,
+    "forecasts": models.WeatherForecast,
+}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def _export_columns(model) -> List:
+    """匯出的欄位 (archived 為內部旗標，不輸出)"""
+    return [c for c in model.__table__.columns if c.name != "archived"]
+
+def _iter_batches(model, start: Optional[date], end: Optional[date]) -> Iterator[List[dict]]:
+    """依 created_at 排序逐批讀取；已封存的紀錄在每批內還原大型欄位"""
+    db = SessionLocal()
+    try:
+        stmt = select(*_export_columns(model), model.archived).order_by(model.created_at, model.id)
+        if start:
+            stmt = stmt.where(model.created_at >= start)
+        if end:
+            stmt = stmt.where(model.created_at < end + timedelta(days=1)) # end 當天包含在內
+
+        result = db.execute(stmt.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+        for partition in result.mappings().partitions():
+            rows = [dict(r) for r in partition]
+            retention.hydrate_rows(db, model.__tablename__, rows)
+            for row in rows:
+                del row["archived"]
+            yield rows
+    finally:
+        db.close()
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _stream_ndjson(batches, columns) -> Iterator[bytes]:
+    for rows in batches:
+        yield "".join(json.dumps(row, ensure_ascii=False, default=_json_default) + "\n" for row in rows).encode("utf-8")
+
+def _stream_csv(batches, columns) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # 加上 BOM 讓 Excel 正確辨識 UTF-8 中文
+    writer.writerow([c.name for c in columns])
+    yield b"\xef\xbb\xbf" + buffer.getvalue().encode("utf-8")
+
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow([
+                row[c.name].isoformat() if isinstance(row[c.name], datetime) else row[c.name]
+                for c in columns
+            ])
+        yield buffer.getvalue().encode("utf-8")
+
+class _ChunkSink:
+    """給 ParquetWriter 寫入的 file-like 物件，每寫完一個 row group 就把累積的 bytes 交給 StreamingResponse"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _parquet_schema(pa, columns):
+    fields = []
+    for c in columns:
+        if isinstance(c.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(c.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(c.type, DateTime):
+            arrow_type = pa.timestamp("us", tz="UTC")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(c.name, arrow_type))
+    return pa.schema(fields)
+
+def _stream_parquet(batches, columns) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(pa, columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for rows in batches:
+            # 每一批寫成一個 row group
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+STREAMERS = {
+    "ndjson": _stream_ndjson,
+    "csv": _stream_csv,
+    "parquet": _stream_parquet,
+}
+
+@router.get("/api/export/{dataset}")
+def export_dataset(dataset: str, format: str = "ndjson", start: Optional[date] = None, end: Optional[date] = None):
+    """
+    串流匯出完整歷史資料。
+    - dataset: warnings / earthquakes / forecasts
+    - format: ndjson (預設) / csv / parquet
+    - start, end: 依 created_at 篩選的日期範圍 (YYYY-MM-DD，皆包含當天)
+    """
+    model = EXPORT_MODELS.get(dataset)
+    if model is None:
+        raise HTTPException(status_code=404, detail="找不到該資料集")
+    if format not in STREAMERS:
+        raise HTTPException(status_code=400, detail="format 僅支援 ndjson / csv / parquet")
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="伺服器未安裝 pyarrow，無法輸出 Parquet")
+
+    columns = _export_columns(model)
+    filename = "_".join(p for p in [model.__tablename__, start and start.isoformat(), end and end.isoformat()] if p)
+    logger.info("Exporting dataset", extra={"pipeline": "export", "dataset": dataset, "format": format, "start": start, "end": end})
+
+    return StreamingResponse(
+        STREAMERS[format](_iter_batches(model, start, end), columns),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'}
+    )
@@ -0,0 +1,91 @@
+"""
+健康檢查
+
+- GET /health/live：process 有回應即可 (不碰資料庫)
+- GET /health/ready：啟動流程 (資料庫連線 / migration / leader election) 完成且資料庫可用時回傳 200，
+  否則回傳 503；同時附上連線池、leader 與上游服務 (CWA / AI Provider) 的狀態供排查。
+  上游服務只做參考，不影響 ready 與否。
+"""
+import os
+import time
+import asyncio
+
+import httpx
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+from database import engine
+import migrations
+import coordination
+import llm
+import logs
+
+router = APIRouter()
+
+CWA_BASE_URL = "https://opendata.cwa.gov.tw/"
+UPSTREAM_CHECK_TTL = 60 # 上游檢查結果快取秒數，避免每次探測都打 CWA
+
+# 由 main.py 的 lifespan 更新
+startup = {"status": "starting", "error": None, "started_at": time.monotonic(), "ready_after_seconds": None}
+
+_upstream_cache = {"checked_at": 0.0, "result": None}
+
+def _check_database() -> dict:
+    started = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return {"status": "ok", "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        return {"status": "error", "error": str(e).splitlines()[0]}
+
+def _pool_status() -> dict:
+    pool = engine.pool
+    status = {"class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            status[name] = getattr(pool, name)()
+    return status
+
+async def _check_upstream() -> dict:
+    now = time.monotonic()
+    if _upstream_cache["result"] is not None and now - _upstream_cache["checked_at"] < UPSTREAM_CHECK_TTL:
+        return _upstream_cache["result"]
+
+    cwa = {"configured": bool(os.getenv("CWA_API_KEY"))}
+    try:
+        async with httpx.AsyncClient(timeout=3.0) as client:
+            resp = await client.head(CWA_BASE_URL)
+        cwa["status"] = "ok" if resp.status_code < 500 else "error"
+        cwa["http_status"] = resp.status_code
+    except httpx.HTTPError as e:
+        cwa["status"] = "unreachable"
+        cwa["error"] = str(e) or type(e).__name__
+
+    key_env = {"gemini": llm.GEMINI_API_KEY, "openai": llm.OPENAI_API_KEY, "groq": llm.GROQ_API_KEY}
+    ai = {"provider": llm.AI_PROVIDER, "model": llm.AI_MODEL, "configured": bool(key_env.get(llm.AI_PROVIDER))}
+
+    result = {"cwa": cwa, "ai": ai}
+    _upstream_cache.update(checked_at=now, result=result)
+    return result
+
+@router.get("/health/live")
+def liveness():
+    return {"status": "ok"}
+
+@router.get("/health/ready")
+async def readiness():
+    database = await asyncio.to_thread(_check_database)
+    ready = startup["status"] == "ready" and database["status"] == "ok"
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "startup": {k: v for k, v in startup.items() if k != "started_at"},
+        "database": database,
+        "pool": _pool_status(),
+        "migrations": migrations.state,
+        "leader": coordination.elector.status(),
+        "upstream": await _check_upstream(),
+        "logging": {"dropped": logs.dropped()},
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
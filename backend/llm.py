@@ -0,0 +1,121 @@
+"""
+AI Provider (Gemini / OpenAI / Groq) 呼叫與速率限制
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+
+AI_PROVIDER = os.getenv("AI_PROVIDER", "gemini").lower()
+AI_MODEL = os.getenv("AI_MODEL", "gemini-1.5-flash")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+logger = logging.getLogger(__name__)
+
+# 各 Provider 預設每分鐘請求上限 (以免費 / 入門方案為準)，可用 AI_RATE_LIMIT_RPM 覆寫
+DEFAULT_RPM = {"gemini": 15, "openai": 60, "groq": 30}
+AI_RATE_LIMIT_RPM = int(os.getenv("AI_RATE_LIMIT_RPM", "0")) or DEFAULT_RPM.get(AI_PROVIDER, 15)
+# 批次作業只能使用額度的這個比例，其餘留給即時的地震 / 特報 / 整點預報，避免批次期間即時呼叫收到 429
+AI_BATCH_RATE_SHARE = float(os.getenv("AI_BATCH_RATE_SHARE", "0.5"))
+
+class AIConfigError(Exception):
+    """Provider 未設定 API Key"""
+
+class RateLimiter:
+    """async 速率限制器：將呼叫平均分散，每分鐘最多 rpm 次"""
+
+    def __init__(self, rpm: int):
+        self.interval = 60.0 / max(rpm, 1)
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+_rate_limiter: Optional[RateLimiter] = None
+
+def batch_rpm() -> int:
+    return max(1, int(AI_RATE_LIMIT_RPM * AI_BATCH_RATE_SHARE))
+
+def rate_limiter() -> RateLimiter:
+    """批次作業共用的速率限制器 (每分鐘 batch_rpm() 次)"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(batch_rpm())
+    return _rate_limiter
+
+async def _chat_completion(client: httpx.AsyncClient, url: str, api_key: str, system_prompt: str, user_content: str) -> str:
+    """OpenAI 相容的 Chat Completions API (OpenAI / Groq)"""
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {
+        "model": AI_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ]
+    }
+    resp = await client.post(url, headers=headers, json=payload, timeout=30.0)
+    resp.raise_for_status()
+    return resp.json()["choices"][0]["message"]["content"]
+
+async def complete(system_prompt: str, user_content: str, client: Optional[httpx.AsyncClient] = None) -> str:
+    """
+    呼叫目前設定的 AI Provider。
+    失敗時直接拋出例外 (未設定 Key 為 AIConfigError)，給需要區分成功 / 失敗的呼叫端使用。
+    """
+    if client is None:
+        async with httpx.AsyncClient() as own_client:
+            return await complete(system_prompt, user_content, own_client)
+
+    if AI_PROVIDER == "openai":
+        if not OPENAI_API_KEY: raise AIConfigError("未設定 OpenAI API Key")
+        return await _chat_completion(client, "https://api.openai.com/v1/chat/completions", OPENAI_API_KEY, system_prompt, user_content)
+
+    elif AI_PROVIDER == "groq":
+        if not GROQ_API_KEY: raise AIConfigError("未設定 Groq API Key")
+        return await _chat_completion(client, "https://api.groq.com/openai/v1/chat/completions", GROQ_API_KEY, system_prompt, user_content)
+
+    else: # Default to Gemini
+        if not GEMINI_API_KEY: raise AIConfigError("未設定 Gemini Key")
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{AI_MODEL}:generateContent?key={GEMINI_API_KEY}"
+        full_prompt = system_prompt + "\n" + user_content
+        resp = await client.post(
+            url,
+            json={"contents": [{"parts": [{"text": full_prompt}]}]},
+            timeout=20.0
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        result_text = data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text")
+        if not result_text:
+            raise ValueError("AI 生成失敗")
+        return result_text
+
+async def generate_ai_text(system_prompt: str, user_content: str) -> str:
+    """呼叫 AI 生成文字 (通用函式)，失敗時回傳提示文字而不拋出例外"""
+    started = time.perf_counter()
+    fields = {"provider": AI_PROVIDER, "model": AI_MODEL}
+    try:
+        result_text = await complete(system_prompt, user_content)
+    except AIConfigError as e:
+        return str(e)
+    except Exception as e:
+        logger.error("AI generation error: %s", e, extra=fields)
+        return "AI 分析暫時無法使用。"
+
+    # 完整報告超過 LOG_MAX_FIELD_CHARS 時會被截斷
+    logger.info("AI report generated", extra={
+        **fields, "chars": len(result_text),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1), "ai_report": result_text
+    })
+    return result_text
@@ -0,0 +1,136 @@
+"""
+結構化 log (Backend 與排程器共用)
+
+呼叫端只把 LogRecord 放進有上限的 queue，不會因 stdout pipe 塞住 (Docker log driver 較慢時) 而卡住 event loop；
+由背景的 QueueListener thread 格式化為一行 JSON 輸出到 stdout。queue 滿時直接丟棄並計數。
+
+額外欄位以 extra 傳入，例如：
+    logger.info("New earthquake found", extra={"pipeline": "earthquakes", "record_id": eq_no})
+
+環境變數：
+- LOG_LEVEL：預設 log 等級 (預設 INFO)
+- LOG_LEVELS：個別 logger 的等級，例如 "llm=DEBUG,coordination=WARNING"
+- LOG_FORMAT：json (預設) 或 text (本機開發較易閱讀)
+- LOG_MAX_FIELD_CHARS：字串欄位 (含訊息) 超過此長度即截斷，例如完整的 AI 報告 (預設 500，0 為不截斷)
+- LOG_QUEUE_SIZE：queue 上限筆數 (預設 10000)
+"""
+import os
+import sys
+import json
+import copy
+import queue
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "500"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# LogRecord 內建屬性，其餘屬性視為 extra 欄位 (color_message 是 uvicorn 附帶的 ANSI 彩色版訊息)
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "color_message"}
+
+_state = {"listener": None, "dropped": 0}
+
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+def truncate(value, limit: int = None):
+    limit = LOG_MAX_FIELD_CHARS if limit is None else limit
+    if limit and isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}...(+{len(value) - limit} chars)"
+    return value
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {k: truncate(v) for k, v in vars(record).items() if k not in _RESERVED and not k.startswith("_")}
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "msg": truncate(record.getMessage()),
+        }
+        entry.update(_fields(record))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        ts = datetime.fromtimestamp(record.created).isoformat(sep=" ", timespec="milliseconds")
+        extra = " ".join(f"{k}={v}" for k, v in _fields(record).items())
+        line = f"{ts} {record.levelname:<7} {record.name}: {truncate(record.getMessage())}"
+        if extra:
+            line = f"{line} [{extra}]"
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """只做最少的工作：組好訊息字串後放入 queue，queue 滿時丟棄"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _state["dropped"] += 1
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def setup(service: str):
+    """設定 root logger；重複呼叫 (例如 uvicorn --reload) 不會重複加 handler"""
+    if _state["listener"] is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter(service))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    listener.start()
+    atexit.register(listener.stop) # 結束前把 queue 中剩下的 log 寫完
+    _state["listener"] = listener
+
+    root = logging.getLogger()
+    root.handlers = [NonBlockingQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    # uvicorn 啟動時 (import app 之前) 會替自己的 logger 裝上同步寫 stdout 的 handler 並關閉 propagate，
+    # 移除後改經由 root 的 queue 輸出，access log 也是 JSON 且不會卡住 event loop
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+    logging.captureWarnings(True) # warnings.warn (例如套件的 DeprecationWarning) 也以 JSON 輸出
+    # 第三方套件的 log 過多，除非個別指定，維持 WARNING
+    levels = {"httpx": "WARNING", "httpcore": "WARNING", "apscheduler.executors.default": "WARNING"}
+    levels.update(_parse_levels(LOG_LEVELS))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+def dropped() -> int:
+    """queue 滿而丟棄的 log 筆數"""
+    return _state["dropped"]
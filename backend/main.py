@@ -1,27 +1,99 @@
 import os
 import json
+import time
+import hashlib
+import logging
+import asyncio
+import threading
 import httpx
-from fastapi import FastAPI, HTTPException, Depends
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from typing import List, Optional
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import DateTime, or_, text
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 
+# 需在讀取環境變數的模組 (database / llm) 被 import 前載入 .env
+load_dotenv()
+
+import logs
+logs.setup("backend")
+logger = logging.getLogger(__name__)
+
 # DB imports
-from database import engine, Base, get_db
+from database import get_db
 import models
+import retention
+import export
+import regenerate
+import prompts
+import coordination
+import migrations
+import health
+import profiling
+import cwa
+import llm
+from responses import ORJSONResponse, RawJSONResponse, weather_json, dumps
+from llm import generate_ai_text, AI_PROVIDER, AI_MODEL
+
+async def prepare_backend(stop: threading.Event):
+    """
+    背景啟動流程：等待資料庫 -> 套用 migration -> 開始 LISTEN 與 leader election。
+    HTTP 服務不等這些完成就開始接受請求，完成前 /health/ready 回傳 503。
+    資料庫階段失敗 (例如 migration 途中斷線) 時以 exponential backoff 整段重試，不會停在失敗狀態。
+    """
+    delay = 1.0
+    while True:
+        try:
+            if not await asyncio.to_thread(migrations.wait_for_database, stop):
+                return # 服務關閉中
+            await asyncio.to_thread(migrations.run_migrations)
+            break
+        except Exception as e:
+            health.startup.update(status="retrying", error=str(e).splitlines()[0])
+            logger.exception("Backend startup failed, retrying in %.1fs", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, migrations.DB_RETRY_MAX_DELAY)
 
-# 初始化資料庫 Table
-models.Base.metadata.create_all(bind=engine)
+    coordination.listener.start()
+    # 只有 leader 執行批次重新生成工作：當選時繼續上次中斷的工作，卸任時中斷交給新的 leader
+    coordination.elector.on_elected(regenerate.resume_interrupted_jobs)
+    coordination.elector.on_demoted(regenerate.stop_running_jobs)
+    await coordination.elector.start()
 
-load_dotenv()
+    elapsed = round(time.monotonic() - health.startup["started_at"], 2)
+    health.startup.update(status="ready", error=None, ready_after_seconds=elapsed)
+    logger.info("Backend ready", extra={"duration_ms": round(elapsed * 1000)})
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_stop = threading.Event()
+    startup_task = asyncio.create_task(prepare_backend(startup_stop))
+    yield
+    # 先讓 thread 中的等待迴圈結束，關閉時才不會卡在 default executor 的 join
+    startup_stop.set()
+    startup_task.cancel()
+    await asyncio.gather(startup_task, return_exceptions=True)
+    await regenerate.stop_running_jobs()
+    await coordination.elector.stop()
+    coordination.listener.stop()
+    await cwa.close()
 
+app = FastAPI(lifespan=lifespan)
+
+# 效能分析只在啟用時安裝；放在 LeaderRoutingMiddleware 內層，只分析實際在本機執行的請求
+if profiling.PROFILING_ENABLED or profiling.PROFILE_CRON:
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(profiling.router)
+
+# follower 收到需要 leader 的請求 (cron / 播報 / 重新生成) 時轉送給 leader；執行途中卸任的請求回 503
+app.add_middleware(coordination.LeaderRoutingMiddleware)
+app.add_exception_handler(coordination.NotLeaderError, coordination.not_leader_handler)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -30,13 +102,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(health.router)
+app.include_router(export.router)
+app.include_router(regenerate.router)
+app.include_router(cwa.router)
+
 # Config
 CWA_API_KEY = os.getenv("CWA_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-AI_PROVIDER = os.getenv("AI_PROVIDER", "gemini").lower()
-AI_MODEL = os.getenv("AI_MODEL", "gemini-1.5-flash")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+# 整點預報預先生成稿：與最新資料差異超過門檻時才重新生成
+DRAFT_POP_DELTA = int(os.getenv("DRAFT_POP_DELTA", "20")) # 降雨機率變化 (百分點)
+DRAFT_TEMP_DELTA = int(os.getenv("DRAFT_TEMP_DELTA", "2")) # 溫度變化 (度)
 
 TTS_API_URL = "http://10.9.0.35:5456/api/stream-speak"
 TTS_ENGINE = "indextts"
@@ -98,99 +174,51 @@ class ForecastRecord(BaseModel):
     class Config:
         orm_mode = True
 
+# 歷史列表輸出的欄位 (與上面的 Record 一致) 與排序欄位，列表端點與 /api/dashboard 共用
+HISTORY_LISTS = {
+    "forecasts": (models.WeatherForecast, ("id", "report_time", "overview", "ai_report", "created_at"), "created_at"),
+    "warnings": (models.WeatherWarning, ("id", "title", "issue_time", "content", "affected_areas", "ai_report", "created_at"), "issue_time"),
+    "earthquakes": (models.EarthquakeAlert, ("id", "earthquake_no", "report_type", "origin_time", "location", "magnitude",
+                                             "content", "intensity_summary", "ai_report", "created_at"), "origin_time"),
+}
+
+def history_query(db: Session, name: str):
+    """歷史列表的欄位查詢 (含 archived 旗標，供還原封存欄位)"""
+    model, fields, _ = HISTORY_LISTS[name]
+    return db.query(*[getattr(model, f) for f in fields], model.archived)
+
 # --- Helper Functions ---
 
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
 async def send_to_tts_api(text: str):
     """將文字發送到 TTS 服務"""
-    print(f"[{datetime.now()}] Sending to TTS API...")
+    started = time.perf_counter()
     try:
         payload = {"engine": TTS_ENGINE, "text": text}
         async with httpx.AsyncClient(timeout=30.0) as client:
             resp = await client.post(TTS_API_URL, json=payload)
-            if resp.status_code == 200:
-                print("TTS API Sent SUCCESS!")
-            else:
-                print(f"TTS API Failed: {resp.status_code} - {resp.text}")
+        fields = {"pipeline": "tts", "chars": len(text), "duration_ms": elapsed_ms(started)}
+        if resp.status_code == 200:
+            logger.info("TTS sent", extra=fields)
+        else:
+            logger.error("TTS failed", extra={**fields, "status_code": resp.status_code, "response": resp.text})
     except Exception as e:
-        print(f"TTS API Connection Error: {e}")
-
-async def generate_ai_text(system_prompt: str, user_content: str) -> str:
-    """呼叫 AI 生成文字 (通用函式)"""
-    async with httpx.AsyncClient() as client:
-        try:
-            if AI_PROVIDER == "openai":
-                if not OPENAI_API_KEY: return "未設定 OpenAI API Key"
-                url = "https://api.openai.com/v1/chat/completions"
-                headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-                payload = {
-                    "model": AI_MODEL,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_content}
-                    ]
-                }
-                resp = await client.post(url, headers=headers, json=payload, timeout=30.0)
-                resp.raise_for_status()
-                result_text = resp.json()["choices"][0]["message"]["content"]
-                print(f"\n[AI REPORT GENERATED ({AI_PROVIDER})]:\n{'-'*20}\n{result_text}\n{'-'*20}\n")
-                return result_text
-
-            elif AI_PROVIDER == "groq":
-                if not GROQ_API_KEY: return "未設定 Groq API Key"
-                url = "https://api.groq.com/openai/v1/chat/completions"
-                headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-                payload = {
-                    "model": AI_MODEL,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_content}
-                    ]
-                }
-                resp = await client.post(url, headers=headers, json=payload, timeout=30.0)
-                resp.raise_for_status()
-                result_text = resp.json()["choices"][0]["message"]["content"]
-                print(f"\n[AI REPORT GENERATED ({AI_PROVIDER})]:\n{'-'*20}\n{result_text}\n{'-'*20}\n")
-                return result_text
-
-            else: # Default to Gemini
-                if not GEMINI_API_KEY: return "未設定 Gemini Key"
-                url = f"https://generativelanguage.googleapis.com/v1beta/models/{AI_MODEL}:generateContent?key={GEMINI_API_KEY}"
-                full_prompt = system_prompt + "\n" + user_content
-                resp = await client.post(
-                    url, 
-                    json={"contents": [{"parts": [{"text": full_prompt}]}]},
-                    timeout=20.0
-                )
-                resp.raise_for_status()
-                data = resp.json()
-                result_text = data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "AI 生成失敗")
-                
-                # --- LOGGING FULL AI REPORT ---
-                print(f"\n[AI REPORT GENERATED ({AI_PROVIDER})]:\n{'-'*20}\n{result_text}\n{'-'*20}\n")
-                
-                return result_text
-
-        except Exception as e:
-            print(f"AI Generation Error ({AI_PROVIDER}): {str(e)}")
-            return "AI 分析暫時無法使用。"
+        logger.error("TTS connection error: %s", e, extra={"pipeline": "tts"})
 
-async def fetch_overview(client: httpx.AsyncClient) -> str:
+async def fetch_overview() -> str:
     """(保留) 抓取全臺天氣概況"""
     return ""
 
-async def fetch_cities_forecast(client: httpx.AsyncClient) -> List[CityWeather]:
-    """抓取各縣市預報 (F-C0032-001)"""
+async def fetch_cities_forecast() -> List[CityWeather]:
+    """抓取各縣市預報 (F-C0032-001)，經 CWA gateway 共用快取與請求合併"""
     if not CWA_API_KEY:
         return []
 
-    locations = ",".join(TARGET_CITIES)
-    url = f"https://opendata.cwa.gov.tw/api/v1/rest/datastore/F-C0032-001?Authorization={CWA_API_KEY}&format=JSON&locationName={locations}"
-    
     cities_data = []
     try:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        data = resp.json()
+        data = await cwa.fetch(cwa.FORECAST, {"locationName": ",".join(TARGET_CITIES)})
         raw_locations = data.get("records", {}).get("location", [])
 
         for loc in raw_locations:
@@ -210,82 +238,150 @@ async def fetch_cities_forecast(client: httpx.AsyncClient) -> List[CityWeather]:
                 maxT=get_val("MaxT")
             ))
     except Exception as e:
-        print(f"Error fetching cities: {e}")
+        logger.error("Error fetching cities: %s", e, extra={"pipeline": "forecast"})
         
     return cities_data
 
+def forecast_changed(draft_cities: List[dict], latest_cities: List[dict]) -> Optional[str]:
+    """比對預先生成稿與最新資料，有明顯變化時回傳原因，否則回傳 None"""
+    draft_map = {c["name"]: c for c in draft_cities}
+    if set(draft_map) != {c["name"] for c in latest_cities}:
+        return "縣市清單不同"
+
+    def to_int(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    for latest in latest_cities:
+        draft = draft_map[latest["name"]]
+        if draft["wx"] != latest["wx"]:
+            return f"{latest['name']} 天氣現象 {draft['wx']} -> {latest['wx']}"
+        for key, threshold in (("pop", DRAFT_POP_DELTA), ("minT", DRAFT_TEMP_DELTA), ("maxT", DRAFT_TEMP_DELTA)):
+            old, new = to_int(draft[key]), to_int(latest[key])
+            if old is None or new is None:
+                if draft[key] != latest[key]:
+                    return f"{latest['name']} {key} {draft[key]} -> {latest[key]}"
+            elif abs(new - old) >= threshold:
+                return f"{latest['name']} {key} {old} -> {new}"
+    return None
+
+async def generate_forecast(heading: str = "輸入資料"):
+    """抓取最新縣市預報並生成 AI 報告，回傳 (overview, cities, ai_report)"""
+    overview = await fetch_overview()
+    cities = await fetch_cities_forecast()
+    user_content = prompts.forecast_user_prompt([c.dict() for c in cities], heading=heading)
+    ai_report = await generate_ai_text(prompts.FORECAST_SYSTEM_PROMPT, user_content)
+    return overview, cities, ai_report
+
+def record_rows(db: Session, query, model) -> List[dict]:
+    """
+    欄位查詢 (不建立 ORM 物件) 的結果轉為 dict，並還原已封存的欄位；
+    列表端點直接以 orjson 輸出，不經過 Pydantic 驗證
+    """
+    # 直接以 Core 執行，略過 ORM 的結果處理
+    result = db.connection().execute(query.statement)
+    keys = list(result.keys())
+    rows = [dict(zip(keys, r)) for r in result]
+    retention.hydrate_rows(db, model.__tablename__, rows)
+    for row in rows:
+        row.pop("archived", None)
+    return rows
+
+def cities_json(cities: List[CityWeather]) -> str:
+    return json.dumps([c.dict() for c in cities], ensure_ascii=False)
+
+def save_forecast(db: Session, overview: str, cities: List[CityWeather], ai_report: str, label: str = "fresh"):
+    try:
+        new_forecast = models.WeatherForecast(
+            overview=overview,
+            cities_data=cities_json(cities),
+            ai_report=ai_report
+        )
+        db.add(new_forecast)
+        coordination.notify(db, "forecasts")
+        db.commit()
+        logger.info("Saved forecast", extra={"pipeline": "forecast", "source": label, "record_id": new_forecast.id})
+    except Exception:
+        db.rollback()
+        logger.exception("Error saving forecast to DB", extra={"pipeline": "forecast", "source": label})
+
 # --- API Endpoints ---
 
 # 1. 既有的天氣預報 API
-weather_cache = {"data": None, "last_updated": None}
+# 最新一筆預報的快取 (已編碼的 JSON)，leader 寫入新預報時透過 NOTIFY 讓所有 replica 清除
+# generation 在每次失效時遞增，避免查詢期間收到的失效通知被舊資料覆蓋
+weather_cache = {"data": None, "last_updated": None, "generation": 0}
+
+def invalidate_weather_cache():
+    weather_cache["data"] = None
+    weather_cache["last_updated"] = None
+    weather_cache["generation"] += 1
+
+coordination.on_invalidate("forecasts", invalidate_weather_cache)
+
+def latest_forecast_json(db: Session, row: dict, generation: int) -> bytes:
+    """
+    由最新一筆預報 (id / archived / overview / cities_data / ai_report) 組出 WeatherResponse JSON，
+    查詢後快取未失效 (generation 相同) 才寫入快取
+    """
+    retention.hydrate_rows(db, models.WeatherForecast.__tablename__, [row])
+    # cities_data 直接嵌入輸出，不解析再編碼
+    body = weather_json(row["overview"], row["cities_data"], row["ai_report"])
+    if weather_cache["generation"] == generation:
+        weather_cache["data"] = body
+        weather_cache["last_updated"] = datetime.now()
+    return body
+
+def latest_weather_json(db: Session) -> Optional[bytes]:
+    """最新一筆預報的 JSON (優先使用快取)，DB 沒有資料時回傳 None"""
+    # LISTEN 連線中斷時可能漏掉失效通知，此時不使用快取
+    if weather_cache["data"] is not None and coordination.listener.healthy():
+        return weather_cache["data"]
+
+    generation = weather_cache["generation"]
+    model = models.WeatherForecast
+    latest_forecast = db.query(
+        model.id, model.created_at, model.archived, model.overview, model.cities_data, model.ai_report
+    ).order_by(model.created_at.desc()).first()
+    if not latest_forecast:
+        return None
+    logger.debug("Returning latest forecast from DB", extra={"pipeline": "forecast", "record_id": latest_forecast.id})
+    return latest_forecast_json(db, dict(latest_forecast._mapping), generation)
 
 @app.get("/api/weather", response_model=WeatherResponse)
 async def get_weather(refresh: bool = False, db: Session = Depends(get_db)):
     global weather_cache
     now = datetime.now()
     
-    # --- 1. 如果不是強制更新，先從 DB 抓取最新的一筆紀錄 ---
+    # --- 1. 如果不是強制更新，先看快取，再從 DB 抓取最新的一筆紀錄 ---
     if not refresh:
-        latest_forecast = db.query(models.WeatherForecast).order_by(models.WeatherForecast.created_at.desc()).first()
-        if latest_forecast:
-            print(f"Returning latest forecast from DB (ID: {latest_forecast.id})")
-            try:
-                cities_list = json.loads(latest_forecast.cities_data)
-                return WeatherResponse(
-                    overview=latest_forecast.overview or "",
-                    cities=[CityWeather(**c) for c in cities_list],
-                    ai_report=latest_forecast.ai_report or ""
-                )
-            except Exception as e:
-                print(f"Error parsing DB cities_data: {e}")
-                # 失敗則往下走抓取邏輯
+        body = latest_weather_json(db)
+        if body is not None:
+            return RawJSONResponse(body)
 
     # --- 2. 抓取新資料並生成 AI 報告 (只有 refresh=True 或 DB 為空時執行) ---
-    print("Fetching fresh weather data and generating AI report...")
-    async with httpx.AsyncClient() as client:
-        overview = await fetch_overview(client)
-        cities = await fetch_cities_forecast(client)
-        
-        # 一般天氣預報的 Prompt
-        cities_summary = "\n".join([f"{c.name}: {c.wx}, {c.minT}-{c.maxT}度, 降雨{c.pop}%" for c in cities])
-        system_prompt = """
-        你現在是一位專業且精準的氣象分析師。請根據以下資料撰寫最新的整點氣象快訊。
-    
-        【嚴格要求】:
-        1. **絕對不要**使用任何寒暄語或開場白。
-        2. **直接切入**天氣重點。
-        3. 語氣要像即時通訊軟體中的「重點整理」一樣，簡潔有力但保有專業度。
-        4. 請根據數據分析目前是受什麼天氣系統（如東北季風、鋒面）影響。
-        5. 針對接下來 1-3 小時做簡單的穿著或攜帶雨具建議。
-        6. 字數約 200-250 字。
-        """
-        user_content = f"【輸入資料】:\n{cities_summary}"
-        
-        ai_report = await generate_ai_text(system_prompt, user_content)
-        
-        response_data = WeatherResponse(overview=overview, cities=cities, ai_report=ai_report)
-        weather_cache["data"] = response_data
-        weather_cache["last_updated"] = now
-        
-        # Save to DB
-        try:
-            cities_json = json.dumps([c.dict() for c in cities], ensure_ascii=False)
-            new_forecast = models.WeatherForecast(
-                overview=overview,
-                cities_data=cities_json,
-                ai_report=ai_report
-            )
-            db.add(new_forecast)
-            db.commit()
-            print(f"Saved fresh forecast to DB with ID: {new_forecast.id}")
-        except Exception as e:
-            print(f"Error saving forecast to DB: {e}")
+    if not coordination.elector.is_leader:
+        # 生成只在 leader 執行 (refresh=true 已由 middleware 轉送)
+        raise HTTPException(status_code=503, detail="尚無預報資料，請稍後再試")
+    logger.info("Fetching fresh weather data and generating AI report", extra={"pipeline": "forecast"})
+    overview, cities, ai_report = await generate_forecast()
 
-        return response_data
+    body = weather_json(overview, cities_json(cities), ai_report)
+    weather_cache["data"] = body
+    weather_cache["last_updated"] = now
+
+    # Save to DB
+    coordination.ensure_leader()
+    save_forecast(db, overview, cities, ai_report)
+
+    return RawJSONResponse(body)
 
 @app.get("/api/forecasts", response_model=List[ForecastRecord])
 def get_forecasts(skip: int = 0, limit: int = 10, q: Optional[str] = None, db: Session = Depends(get_db)):
-    query = db.query(models.WeatherForecast)
+    m = models.WeatherForecast
+    query = history_query(db, "forecasts")
     
     if q:
         # Search in AI report or Overview
@@ -298,8 +394,13 @@ def get_forecasts(skip: int = 0, limit: int = 10, q: Optional[str] = None, db: S
             models.WeatherForecast.overview.ilike(search)
         ))
     
-    forecasts = query.order_by(models.WeatherForecast.created_at.desc()).offset(skip).limit(limit).all()
-    return forecasts
+    forecasts = query.order_by(models.WeatherForecast.created_at.desc()).offset(skip).limit(limit)
+    return ORJSONResponse(record_rows(db, forecasts, m))
+
+@app.get("/api/cluster")
+def get_cluster_status():
+    """回傳本 replica 的 leader election 狀態"""
+    return coordination.elector.status()
 
 @app.get("/api/config")
 def get_config():
@@ -314,72 +415,153 @@ async def manual_weather_broadcast(db: Session = Depends(get_db)):
     """
     手動觸發：抓取最新天氣、生成 AI 報告並立即語音播報
     """
-    print(f"[{datetime.now()}] Manually triggering weather broadcast...")
-    async with httpx.AsyncClient() as client:
-        overview = await fetch_overview(client)
-        cities = await fetch_cities_forecast(client)
-        
-        cities_summary = "\n".join([f"{c.name}: {c.wx}, {c.minT}-{c.maxT}度, 降雨{c.pop}%" for c in cities])
-        system_prompt = """
-        你現在是一位專業且精準的氣象分析師。請根據以下資料撰寫最新的整點氣象快訊。
-    
-        【嚴格要求】:
-        1. **絕對不要**使用任何寒暄語或開場白。
-        2. **直接切入**天氣重點。
-        3. 語氣要像即時通訊軟體中的「重點整理」一樣，簡潔有力但保有專業度。
-        4. 請根據數據分析目前是受什麼天氣系統（如東北季風、鋒面）影響。
-        5. 針對接下來 1-3 小時做簡單的穿著或攜帶雨具建議。
-        6. 字數約 200-250 字。
-        """
-        user_content = f"【最新觀測資料】:\n{cities_summary}"
-        
-        ai_report = await generate_ai_text(system_prompt, user_content)
-        
-        # 立即播報
-        await send_to_tts_api(ai_report)
-        
-        # Save to DB
+    logger.info("Manually triggering weather broadcast", extra={"pipeline": "forecast"})
+    overview, cities, ai_report = await generate_forecast(heading="最新觀測資料")
+
+    # 立即播報
+    coordination.ensure_leader()
+    await send_to_tts_api(ai_report)
+
+    # Save to DB
+    coordination.ensure_leader()
+    save_forecast(db, overview, cities, ai_report, label="manual broadcast")
+
+    return {"status": "success", "ai_report": ai_report}
+
+def _next_top_of_hour(now: datetime) -> datetime:
+    return now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+@app.post("/api/weather/prepare")
+async def prepare_hourly_forecast(db: Session = Depends(get_db)):
+    """
+    整點前由排程器呼叫：預先抓取資料並生成下一個整點的廣播稿，存為草稿
+    """
+    target_hour = _next_top_of_hour(datetime.now().astimezone())
+    started = time.perf_counter()
+    logger.info("Preparing forecast draft", extra={"pipeline": "forecast", "target_hour": target_hour})
+
+    overview = await fetch_overview()
+    cities = await fetch_cities_forecast()
+    if not cities:
+        return {"status": "error", "message": "No city data fetched"}
+
+    # 不用 generate_ai_text：失敗時它會回傳提示文字，存成草稿後整點會被直接播報。
+    # 生成失敗就不存草稿，整點時改為完整重新生成
+    user_content = prompts.forecast_user_prompt([c.dict() for c in cities])
+    try:
+        ai_report = await llm.complete(prompts.FORECAST_SYSTEM_PROMPT, user_content)
+    except Exception as e:
+        logger.error("Forecast draft generation failed: %s", e, extra={"pipeline": "forecast", "target_hour": target_hour})
+        return {"status": "error", "message": "AI 生成失敗，整點時將重新生成"}
+
+    draft = db.query(models.ForecastDraft).filter(models.ForecastDraft.target_hour == target_hour).first()
+    if not draft:
+        draft = models.ForecastDraft(target_hour=target_hour)
+        db.add(draft)
+    draft.overview = overview
+    draft.cities_data = cities_json(cities)
+    draft.ai_report = ai_report
+    draft.published_at = None
+
+    # 清除過期草稿
+    db.query(models.ForecastDraft).filter(
+        models.ForecastDraft.target_hour < target_hour - timedelta(days=1)
+    ).delete(synchronize_session=False)
+    coordination.ensure_leader()
+    db.commit()
+    logger.info("Forecast draft ready", extra={
+        "pipeline": "forecast", "record_id": draft.id, "target_hour": target_hour, "duration_ms": elapsed_ms(started)
+    })
+
+    return {"status": "success", "draft_id": draft.id, "target_hour": target_hour}
+
+@app.post("/api/weather/publish")
+async def publish_hourly_forecast(db: Session = Depends(get_db)):
+    """
+    整點由排程器呼叫：以最新 CWA 資料驗證草稿，沒有明顯變化就直接播報草稿，
+    否則 (或沒有草稿時) 才完整重新生成；重新生成失敗時改播草稿，沒有草稿則不播報
+    """
+    global weather_cache
+    now = datetime.now().astimezone()
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+
+    # 排程器可能稍早或稍晚觸發，取最接近本整點且尚未播報的草稿
+    draft = db.query(models.ForecastDraft).filter(
+        models.ForecastDraft.target_hour >= current_hour - timedelta(minutes=30),
+        models.ForecastDraft.target_hour <= current_hour + timedelta(hours=1),
+        models.ForecastDraft.published_at.is_(None)
+    ).order_by(models.ForecastDraft.target_hour).first()
+
+    latest_cities = await fetch_cities_forecast()
+    if not draft and not latest_cities:
+        logger.error("No forecast draft or city data, skipping hourly broadcast", extra={"pipeline": "forecast"})
+        return {"status": "error", "message": "No city data fetched"}
+
+    source = "draft"
+    if not draft:
+        source, reason = "regenerated", "沒有預先生成的草稿"
+    elif latest_cities:
+        reason = forecast_changed(json.loads(draft.cities_data), [c.dict() for c in latest_cities])
+        if reason:
+            source = "regenerated"
+    else:
+        reason = None # CWA 暫時無法取得，直接使用草稿
+
+    if source == "draft":
+        overview = draft.overview or ""
+        cities = latest_cities or [CityWeather(**c) for c in json.loads(draft.cities_data)]
+        ai_report = draft.ai_report
+        logger.info("Publishing forecast draft", extra={"pipeline": "forecast", "record_id": draft.id})
+    else:
+        logger.info("Regenerating hourly forecast: %s", reason, extra={"pipeline": "forecast"})
+        overview = await fetch_overview()
+        cities = latest_cities
+        user_content = prompts.forecast_user_prompt([c.dict() for c in cities])
+        # 與 prepare 相同不用 generate_ai_text：失敗時不能把提示文字當成預報播出
         try:
-            # Serialize cities data to JSON string for storage
-            cities_json = json.dumps([c.dict() for c in cities], ensure_ascii=False)
-            
-            new_forecast = models.WeatherForecast(
-                overview=overview,
-                cities_data=cities_json,
-                ai_report=ai_report
-            )
-            db.add(new_forecast)
-            db.commit()
-            print(f"Saved manual broadcast forecast to DB with ID: {new_forecast.id}")
+            ai_report = await llm.complete(prompts.FORECAST_SYSTEM_PROMPT, user_content)
         except Exception as e:
-            print(f"Error saving forecast to DB: {e}")
-        
-        return {"status": "success", "ai_report": ai_report}
+            if not draft:
+                logger.error("Hourly forecast generation failed, skipping broadcast: %s", e, extra={"pipeline": "forecast"})
+                return {"status": "error", "message": "AI 生成失敗，本整點不播報"}
+            # 改播草稿 (連同生成草稿時的資料，內容與廣播稿一致)
+            logger.error("Hourly forecast generation failed, publishing draft: %s", e, extra={
+                "pipeline": "forecast", "record_id": draft.id
+            })
+            source = "draft_fallback"
+            overview = draft.overview or ""
+            cities = [CityWeather(**c) for c in json.loads(draft.cities_data)]
+            ai_report = draft.ai_report
+
+    # 立即播報
+    coordination.ensure_leader()
+    await send_to_tts_api(ai_report)
+
+    weather_cache["data"] = weather_json(overview, cities_json(cities), ai_report)
+    weather_cache["last_updated"] = now
+    if draft:
+        draft.published_at = now
+    coordination.ensure_leader()
+    save_forecast(db, overview, cities, ai_report, label=f"hourly ({source})")
+
+    return {"status": "success", "source": source, "reason": reason, "ai_report": ai_report}
 
 @app.get("/api/weather/{city_name}", response_model=CityWeather)
 async def get_city_weather(city_name: str):
-    async with httpx.AsyncClient() as client:
-        if not CWA_API_KEY: raise HTTPException(status_code=500, detail="未設定 CWA API Key")
-        url = f"https://opendata.cwa.gov.tw/api/v1/rest/datastore/F-C0032-001?Authorization={CWA_API_KEY}&format=JSON&locationName={city_name}"
-        try:
-            resp = await client.get(url)
-            resp.raise_for_status()
-            data = resp.json()
-            location = data.get("records", {}).get("location", [])
-            if not location: raise HTTPException(status_code=404, detail="找不到縣市")
-            loc = location[0]
-            weather_elements = loc.get("weatherElement", [])
-            def get_val(name):
-                el = next((e for e in weather_elements if e["elementName"] == name), None)
-                return el["time"][0]["parameter"]["parameterName"] if el and el.get("time") else "-"
-            return CityWeather(name=loc["locationName"], wx=get_val("Wx"), pop=get_val("PoP"), minT=get_val("MinT"), maxT=get_val("MaxT"))
-        except Exception as e:
-             raise HTTPException(status_code=500, detail=str(e))
+    """單一縣市預報：取自與 cron 共用的 22 縣市預報 (CWA gateway 快取)，不再每次請求都打 CWA"""
+    if not CWA_API_KEY: raise HTTPException(status_code=500, detail="未設定 CWA API Key")
+    if city_name not in TARGET_CITIES: raise HTTPException(status_code=404, detail="找不到縣市")
+    cities = await fetch_cities_forecast()
+    if not cities: raise HTTPException(status_code=503, detail="暫時無法取得 CWA 預報")
+    city = next((c for c in cities if c.name == city_name), None)
+    if not city: raise HTTPException(status_code=404, detail="找不到縣市")
+    return city
 
 # 2. 新增：查詢歷史特報
 @app.get("/api/warnings", response_model=List[WarningRecord])
 def get_warnings(skip: int = 0, limit: int = 10, q: Optional[str] = None, db: Session = Depends(get_db)):
-    query = db.query(models.WeatherWarning)
+    m = models.WeatherWarning
+    query = history_query(db, "warnings")
     
     if q:
         search = f"%{q}%"
@@ -390,8 +572,8 @@ def get_warnings(skip: int = 0, limit: int = 10, q: Optional[str] = None, db: Se
             models.WeatherWarning.issue_time.ilike(search) # Date search via string match
         ))
 
-    warnings = query.order_by(models.WeatherWarning.issue_time.desc()).offset(skip).limit(limit).all()
-    return warnings
+    warnings = query.order_by(models.WeatherWarning.issue_time.desc()).offset(skip).limit(limit)
+    return ORJSONResponse(record_rows(db, warnings, m))
 
 # 2.1 新增：手動重新播報特報
 @app.post("/api/warnings/{warning_id}/re-report")
@@ -402,35 +584,23 @@ async def re_report_warning(warning_id: int, db: Session = Depends(get_db)):
     warning = db.query(models.WeatherWarning).filter(models.WeatherWarning.id == warning_id).first()
     if not warning:
         raise HTTPException(status_code=404, detail="找不到該特報 ID")
+    retention.hydrate(db, [warning])
 
-    print(f"[{datetime.now()}] Manually re-reporting warning: {warning.title}")
+    logger.info("Manually re-reporting warning", extra={"pipeline": "warnings", "record_id": warning.id, "title": warning.title})
 
-    system_prompt = """
-    你現在是一位專業的氣象主播，負責即時插播氣象特報。
-    請根據接收到的氣象局特報資料，撰寫一段廣播稿。
-    1. **絕對不要**使用任何寒暄語或開場白。
-    2. 開頭直接切入重點。
-    3. 口語化改寫時間與內容。
-    4. 強調受影響地區。
-    5. 簡潔扼要，約 200-250 字。
-    """
-    
-    user_prompt = f"""
-    【特報資料】
-    標題: {warning.title}
-    發布時間: {warning.issue_time}
-    受影響地區: {warning.affected_areas}
-    內容全文: {warning.content}
-    """
+    user_prompt = prompts.warning_user_prompt(warning.title, warning.issue_time, warning.affected_areas, warning.content)
     
     # 重新生成 AI 報告
-    ai_report = await generate_ai_text(system_prompt, user_prompt)
+    ai_report = await generate_ai_text(prompts.WARNING_REREPORT_SYSTEM_PROMPT, user_prompt)
     
     # 重新呼叫 TTS
+    coordination.ensure_leader()
     await send_to_tts_api(ai_report)
     
     # 更新 DB 內容
     warning.ai_report = ai_report
+    coordination.notify(db, "warnings")
+    coordination.ensure_leader()
     db.commit()
     
     return {"status": "success", "ai_report": ai_report}
@@ -441,120 +611,108 @@ async def check_and_process_warnings(db: Session = Depends(get_db)):
     """
     抓取特報 -> 比對 DB -> 若無則生成 AI 報告並播報 -> 存入 DB
     """
-    print(f"[{datetime.now()}] Checking for new warnings...")
+    started = time.perf_counter()
     if not CWA_API_KEY:
         return {"status": "error", "message": "No CWA API Key"}
 
     # W-C0033-002: 各類特報
-    url = f"https://opendata.cwa.gov.tw/api/v1/rest/datastore/W-C0033-002?Authorization={CWA_API_KEY}&format=JSON"
     
     new_warnings_count = 0
     
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url)
-            resp.raise_for_status()
-            data = resp.json()
+        data = await cwa.fetch(cwa.WARNINGS)
+        
+        records = data.get("records", {}).get("record", [])
+        if not isinstance(records, list):
+            records = [records] # 處理單筆可能是 dict 的情況
+
+        for record in records:
+            dataset_info = record.get("datasetInfo", {})
+            dataset_desc = dataset_info.get("datasetDescription", "未分類特報") # Title
+            issue_time = dataset_info.get("issueTime", "")
             
-            records = data.get("records", {}).get("record", [])
-            if not isinstance(records, list):
-                records = [records] # 處理單筆可能是 dict 的情況
-
-            for record in records:
-                dataset_info = record.get("datasetInfo", {})
-                dataset_desc = dataset_info.get("datasetDescription", "未分類特報") # Title
-                issue_time = dataset_info.get("issueTime", "")
-                
-                # 取得內容與地區
-                contents = record.get("contents", {}).get("content", {})
-                content_text = contents.get("contentText", "")
-                
-                # 取得受影響地區
-                affected_areas = []
-                hazards = record.get("hazardConditions", {}).get("hazards", {}).get("hazard", [])
-                if not isinstance(hazards, list): hazards = [hazards]
-                
-                for h in hazards:
-                    info = h.get("info", {})
-                    locations = info.get("affectedAreas", {}).get("location", [])
-                    if not isinstance(locations, list): locations = [locations]
-                    for loc in locations:
-                        if "locationName" in loc:
-                            affected_areas.append(loc["locationName"])
-                
-                affected_areas_str = ", ".join(affected_areas)
+            # 取得內容與地區
+            contents = record.get("contents", {}).get("content", {})
+            content_text = contents.get("contentText", "")
+            
+            # 取得受影響地區
+            affected_areas = []
+            hazards = record.get("hazardConditions", {}).get("hazards", {}).get("hazard", [])
+            if not isinstance(hazards, list): hazards = [hazards]
+            
+            for h in hazards:
+                info = h.get("info", {})
+                locations = info.get("affectedAreas", {}).get("location", [])
+                if not isinstance(locations, list): locations = [locations]
+                for loc in locations:
+                    if "locationName" in loc:
+                        affected_areas.append(loc["locationName"])
+            
+            affected_areas_str = ", ".join(affected_areas)
 
-                # --- 檢查 DB 是否已存在 ---
-                exists = db.query(models.WeatherWarning).filter(
-                    models.WeatherWarning.issue_time == issue_time,
-                    models.WeatherWarning.title == dataset_desc
-                ).first()
+            # --- 檢查 DB 是否已存在 ---
+            exists = db.query(models.WeatherWarning).filter(
+                models.WeatherWarning.issue_time == issue_time,
+                models.WeatherWarning.title == dataset_desc
+            ).first()
 
-                if exists:
-                    print(f"Warning already exists: {dataset_desc} ({issue_time})")
-                    continue
+            if exists:
+                logger.debug("Warning already exists", extra={"pipeline": "warnings", "title": dataset_desc, "issue_time": issue_time})
+                continue
 
-                # --- 這是新特報 ---
-                print(f"New Warning Found: {dataset_desc}")
-                
-                # 生成 AI 廣播稿
-                system_prompt = """
-                你現在是一位專業的氣象主播，負責即時插播氣象特報。
-                請根據接收到的氣象局特報資料，撰寫一段廣播稿。
-
-                【撰寫要求】
-                1. 開頭直接切入重點 (如「氣象署發布...」)。
-                2. 口語化改寫：去除公文式標號，將時間改為自然口語 (如「今天上午」)。
-                3. 強調受影響區域：清楚唸出受影響的縣市。
-                4. 簡潔扼要：保留危險原因與防範措施，約 100-150 字。
-                5. 語氣：急切、權威、清晰。
-                """
-                
-                user_prompt = f"""
-                【特報資料】
-                標題: {dataset_desc}
-                發布時間: {issue_time}
-                受影響地區: {affected_areas_str}
-                內容全文: {content_text}
-                """
-                
-                ai_report = await generate_ai_text(system_prompt, user_prompt)
-                
-                # 呼叫 TTS
-                await send_to_tts_api(ai_report)
-                
-                # 存入 DB
-                try:
-                    new_warning = models.WeatherWarning(
-                        dataset_id="W-C0033-002",
-                        issue_time=issue_time,
-                        title=dataset_desc,
-                        content=content_text,
-                        affected_areas=affected_areas_str,
-                        ai_report=ai_report,
-                        is_reported=True
-                    )
-                    db.add(new_warning)
-                    db.commit()
-                    new_warnings_count += 1
-                except IntegrityError:
-                    db.rollback()
-                    print(f"Duplicate warning record ignored: {dataset_desc} ({issue_time})")
-                except Exception as e:
-                    db.rollback()
-                    print(f"Error saving warning record: {e}")
+            # --- 這是新特報 ---
+            logger.info("New warning found", extra={"pipeline": "warnings", "title": dataset_desc, "issue_time": issue_time})
+            
+            # 生成 AI 廣播稿
+            user_prompt = prompts.warning_user_prompt(dataset_desc, issue_time, affected_areas_str, content_text)
+            
+            ai_report = await generate_ai_text(prompts.WARNING_SYSTEM_PROMPT, user_prompt)
+            
+            # 呼叫 TTS
+            coordination.ensure_leader()
+            await send_to_tts_api(ai_report)
+            
+            # 存入 DB
+            coordination.ensure_leader()
+            try:
+                new_warning = models.WeatherWarning(
+                    dataset_id="W-C0033-002",
+                    issue_time=issue_time,
+                    title=dataset_desc,
+                    content=content_text,
+                    affected_areas=affected_areas_str,
+                    ai_report=ai_report,
+                    is_reported=True
+                )
+                db.add(new_warning)
+                coordination.notify(db, "warnings")
+                db.commit()
+                new_warnings_count += 1
+                logger.info("Saved warning", extra={"pipeline": "warnings", "record_id": new_warning.id, "title": dataset_desc})
+            except IntegrityError:
+                db.rollback()
+                logger.info("Duplicate warning record ignored", extra={"pipeline": "warnings", "title": dataset_desc, "issue_time": issue_time})
+            except Exception:
+                db.rollback()
+                logger.exception("Error saving warning record", extra={"pipeline": "warnings", "title": dataset_desc})
                 
+    except coordination.NotLeaderError:
+        raise
     except Exception as e:
-        print(f"Error processing warnings: {e}")
+        logger.exception("Error processing warnings", extra={"pipeline": "warnings", "duration_ms": elapsed_ms(started)})
         return {"status": "error", "message": str(e)}
 
+    logger.info("Warning check complete", extra={
+        "pipeline": "warnings", "new": new_warnings_count, "duration_ms": elapsed_ms(started)
+    })
     return {"status": "success", "new_warnings_processed": new_warnings_count}
 
 # 4. 新增：地震相關 Endpoints
 
 @app.get("/api/earthquakes", response_model=List[EarthquakeRecord])
 def get_earthquakes(skip: int = 0, limit: int = 10, q: Optional[str] = None, db: Session = Depends(get_db)):
-    query = db.query(models.EarthquakeAlert)
+    m = models.EarthquakeAlert
+    query = history_query(db, "earthquakes")
     
     if q:
         search = f"%{q}%"
@@ -564,8 +722,8 @@ def get_earthquakes(skip: int = 0, limit: int = 10, q: Optional[str] = None, db:
             models.EarthquakeAlert.origin_time.ilike(search)
         ))
 
-    eqs = query.order_by(models.EarthquakeAlert.origin_time.desc()).offset(skip).limit(limit).all()
-    return eqs
+    eqs = query.order_by(models.EarthquakeAlert.origin_time.desc()).offset(skip).limit(limit)
+    return ORJSONResponse(record_rows(db, eqs, m))
 
 @app.post("/api/earthquakes/{eq_id}/re-report")
 async def re_report_earthquake(eq_id: int, db: Session = Depends(get_db)):
@@ -575,37 +733,22 @@ async def re_report_earthquake(eq_id: int, db: Session = Depends(get_db)):
     eq = db.query(models.EarthquakeAlert).filter(models.EarthquakeAlert.id == eq_id).first()
     if not eq:
         raise HTTPException(status_code=404, detail="找不到該地震紀錄 ID")
+    retention.hydrate(db, [eq])
 
-    print(f"[{datetime.now()}] Manually re-reporting earthquake: {eq.earthquake_no}")
+    logger.info("Manually re-reporting earthquake", extra={"pipeline": "earthquakes", "record_id": eq.earthquake_no})
 
-    system_prompt = """
-    你現在是一位專業的新聞主播，負責插播即時地震快訊。
-    請根據接收到的地震資料，撰寫一段廣播稿。
-    
-    【撰寫要求】
-    1. **語氣緊急且嚴肅**，但保持冷靜。
-    2. 開頭直接播報：「氣象署發布顯著有感地震報告...」。
-    3. 清楚唸出：發生時間 (轉為口語，如剛才、今天晚間)、震央位置、芮氏規模。
-    4. **特別強調**：最大震度達到 3 級以上的縣市，若無則強調「最大震度 x 級」。
-    5. 提醒民眾保持冷靜，注意餘震。
-    6. 字數約 150-200 字。
-    """
-    
-    user_prompt = f"""
-    【地震資料】
-    編號: {eq.earthquake_no}
-    時間: {eq.origin_time}
-    規模: {eq.magnitude}
-    深度: {eq.depth} 公里
-    位置: {eq.location}
-    各地震度概要: {eq.intensity_summary}
-    氣象署簡述: {eq.content}
-    """
+    user_prompt = prompts.earthquake_user_prompt(
+        eq.earthquake_no, eq.origin_time, eq.magnitude, eq.depth,
+        eq.location, eq.intensity_summary, eq.content
+    )
     
-    ai_report = await generate_ai_text(system_prompt, user_prompt)
+    ai_report = await generate_ai_text(prompts.EARTHQUAKE_REREPORT_SYSTEM_PROMPT, user_prompt)
+    coordination.ensure_leader()
     await send_to_tts_api(ai_report)
     
     eq.ai_report = ai_report
+    coordination.notify(db, "earthquakes")
+    coordination.ensure_leader()
     db.commit()
     
     return {"status": "success", "ai_report": ai_report}
@@ -615,148 +758,268 @@ async def check_and_process_earthquakes(db: Session = Depends(get_db)):
     """
     每分鐘檢查：抓取 CWA E-A0015-001 -> 比對 DB -> 生成報告 -> 播報 -> 存檔
     """
-    print(f"[{datetime.now()}] Checking for earthquakes...")
+    started = time.perf_counter()
     if not CWA_API_KEY:
         return {"status": "error", "message": "No CWA API Key"}
         
-    url = f"https://opendata.cwa.gov.tw/api/v1/rest/datastore/E-A0015-001?Authorization={CWA_API_KEY}&format=JSON"
-    
     new_eq_count = 0
+    max_magnitude = None # 本次新增地震的最大規模，排程器據此決定是否加快輪詢
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url)
-            resp.raise_for_status()
-            data = resp.json()
+        data = await cwa.fetch(cwa.EARTHQUAKES)
+        
+        # CWA 地震資料結構
+        records = data.get("records", {}).get("Earthquake", [])
+        if not isinstance(records, list): records = [records]
+
+        for item in records:
+            eq_no = item.get("EarthquakeNo") # Unique ID
+            if not eq_no: continue
+            
+            # Check DB
+            exists = db.query(models.EarthquakeNumber).filter(models.EarthquakeNumber.earthquake_no == eq_no).first()
+            if exists:
+                # 假設地震編號相同就是同一筆，不做更新
+                continue
+            
+            # New Earthquake Found
+            logger.info("New earthquake found", extra={"pipeline": "earthquakes", "record_id": eq_no})
+            
+            report_content = item.get("ReportContent", "")
+            eq_info = item.get("EarthquakeInfo", {})
+            origin_time = eq_info.get("OriginTime", "")
+            focal_depth = str(eq_info.get("FocalDepth", ""))
             
-            # CWA 地震資料結構
-            records = data.get("records", {}).get("Earthquake", [])
-            if not isinstance(records, list): records = [records]
+            epicenter = eq_info.get("Epicenter", {})
+            location = epicenter.get("Location", "")
+            
+            magnitude_info = eq_info.get("EarthquakeMagnitude", {})
+            magnitude = str(magnitude_info.get("MagnitudeValue", ""))
+            
+            # 解析震度 (Intensity)
+            shaking_areas = item.get("Intensity", {}).get("ShakingArea", [])
+            if not isinstance(shaking_areas, list): shaking_areas = [shaking_areas]
+            
+            # 整理震度資訊 (例如: "宜蘭縣4級, 花蓮縣3級...")
+            # 使用 dict 來去重，Key 為縣市名稱，Value 為該縣市最大震度資訊
+            county_map = {}
 
-            for item in records:
-                eq_no = item.get("EarthquakeNo") # Unique ID
-                if not eq_no: continue
-                
-                # Check DB
-                exists = db.query(models.EarthquakeAlert).filter(models.EarthquakeAlert.earthquake_no == eq_no).first()
-                if exists:
-                    # 假設地震編號相同就是同一筆，不做更新
-                    continue
-                
-                # New Earthquake Found
-                print(f"New Earthquake Found: {eq_no}")
+            for area in shaking_areas:
+                raw_county = area.get("CountyName", "")
+                if not raw_county: continue
                 
-                report_content = item.get("ReportContent", "")
-                eq_info = item.get("EarthquakeInfo", {})
-                origin_time = eq_info.get("OriginTime", "")
-                focal_depth = str(eq_info.get("FocalDepth", ""))
+                # 清洗縣市名稱 (去除空白)
+                county = raw_county.strip()
                 
-                epicenter = eq_info.get("Epicenter", {})
-                location = epicenter.get("Location", "")
+                intensity_str = area.get("AreaIntensity", "").strip()
                 
-                magnitude_info = eq_info.get("EarthquakeMagnitude", {})
-                magnitude = str(magnitude_info.get("MagnitudeValue", ""))
-                
-                # 解析震度 (Intensity)
-                shaking_areas = item.get("Intensity", {}).get("ShakingArea", [])
-                if not isinstance(shaking_areas, list): shaking_areas = [shaking_areas]
-                
-                # 整理震度資訊 (例如: "宜蘭縣4級, 花蓮縣3級...")
-                # 使用 dict 來去重，Key 為縣市名稱，Value 為該縣市最大震度資訊
-                county_map = {}
-
-                for area in shaking_areas:
-                    raw_county = area.get("CountyName", "")
-                    if not raw_county: continue
-                    
-                    # 清洗縣市名稱 (去除空白)
-                    county = raw_county.strip()
-                    
-                    intensity_str = area.get("AreaIntensity", "").strip()
-                    
-                    # 解析震度數值 (只取第一個數字)
-                    intensity_val = 0
-                    try:
-                        digits = ''.join(filter(str.isdigit, intensity_str))
-                        if digits:
-                            intensity_val = int(digits[0])
-                    except:
-                        pass
-                    
-                    # 如果該縣市未出現過，或新震度比較大，則更新
-                    if county not in county_map or intensity_val > county_map[county]["val"]:
-                        county_map[county] = {
-                            "county": county,
-                            "str": intensity_str,
-                            "val": intensity_val
-                        }
-                
-                # 轉回 list 並依照震度大小排序
-                sorted_intensities = list(county_map.values())
-                sorted_intensities.sort(key=lambda x: x["val"], reverse=True)
-                
-                # 建構完整清單 (不限制數量，因為使用者想要「所有」區域)
-                summary_parts = [f"{item['county']}{item['str']}" for item in sorted_intensities]
-                intensity_summary_str = ", ".join(summary_parts)
-                
-                # Generate AI Report
-                system_prompt = """
-                你現在是一位專業的新聞主播，負責插播即時地震快訊。
-                請根據接收到的地震資料，撰寫一段廣播稿。
-                
-                【撰寫要求】
-                1. **語氣緊急且嚴肅**，但保持冷靜。
-                2. 開頭直接播報：「氣象署發布顯著有感地震報告...」。
-                3. 清楚唸出：發生時間 (轉為口語，如剛才、今天晚間)、震央位置、芮氏規模。
-                4. **特別強調**：最大震度達到 3 級以上的縣市，若無則強調「各地最大震度」。
-                5. 提醒民眾保持冷靜，注意餘震。
-                6. 字數約 150-200 字。
-                """
-                
-                user_prompt = f"""
-                【地震資料】
-                編號: {eq_no}
-                時間: {origin_time}
-                規模: {magnitude}
-                深度: {focal_depth} 公里
-                位置: {location}
-                各地震度概要: {intensity_summary_str}
-                氣象署簡述: {report_content}
-                """
-                
-                ai_report = await generate_ai_text(system_prompt, user_prompt)
-                
-                # TTS
-                await send_to_tts_api(ai_report)
+                # 解析震度數值 (只取第一個數字)
+                intensity_val = 0
+                try:
+                    digits = ''.join(filter(str.isdigit, intensity_str))
+                    if digits:
+                        intensity_val = int(digits[0])
+                except:
+                    pass
                 
-                # Save to DB
+                # 如果該縣市未出現過，或新震度比較大，則更新
+                if county not in county_map or intensity_val > county_map[county]["val"]:
+                    county_map[county] = {
+                        "county": county,
+                        "str": intensity_str,
+                        "val": intensity_val
+                    }
+            
+            # 轉回 list 並依照震度大小排序
+            sorted_intensities = list(county_map.values())
+            sorted_intensities.sort(key=lambda x: x["val"], reverse=True)
+            
+            # 建構完整清單 (不限制數量，因為使用者想要「所有」區域)
+            summary_parts = [f"{item['county']}{item['str']}" for item in sorted_intensities]
+            intensity_summary_str = ", ".join(summary_parts)
+            
+            # Generate AI Report
+            user_prompt = prompts.earthquake_user_prompt(
+                eq_no, origin_time, magnitude, focal_depth,
+                location, intensity_summary_str, report_content
+            )
+            
+            ai_report = await generate_ai_text(prompts.EARTHQUAKE_SYSTEM_PROMPT, user_prompt)
+            
+            # TTS
+            coordination.ensure_leader()
+            await send_to_tts_api(ai_report)
+            
+            # Save to DB
+            coordination.ensure_leader()
+            try:
+                new_eq = models.EarthquakeAlert(
+                    earthquake_no=eq_no,
+                    report_type=item.get("ReportType", "地震報告"),
+                    origin_time=origin_time,
+                    location=location,
+                    magnitude=magnitude,
+                    depth=focal_depth,
+                    content=report_content,
+                    intensity_summary=intensity_summary_str,
+                    ai_report=ai_report,
+                    is_reported=True
+                )
+                db.add(new_eq)
+                # 同一個交易寫入編號：重疊的檢查 (逾時重送、leader 交接) 會在 commit 時觸發 IntegrityError
+                db.add(models.EarthquakeNumber(earthquake_no=eq_no))
+                coordination.notify(db, "earthquakes")
+                db.commit()
+                new_eq_count += 1
+                logger.info("Saved earthquake", extra={"pipeline": "earthquakes", "record_id": eq_no, "magnitude": magnitude})
                 try:
-                    new_eq = models.EarthquakeAlert(
-                        earthquake_no=eq_no,
-                        report_type=item.get("ReportType", "地震報告"),
-                        origin_time=origin_time,
-                        location=location,
-                        magnitude=magnitude,
-                        depth=focal_depth,
-                        content=report_content,
-                        intensity_summary=intensity_summary_str,
-                        ai_report=ai_report,
-                        is_reported=True
-                    )
-                    db.add(new_eq)
-                    db.commit()
-                    new_eq_count += 1
-                except IntegrityError:
-                    db.rollback()
-                    print(f"Duplicate earthquake record ignored: {eq_no}")
-                except Exception as e:
-                    db.rollback()
-                    print(f"Error saving earthquake record {eq_no}: {e}")
+                    max_magnitude = max(max_magnitude or 0.0, float(magnitude))
+                except ValueError:
+                    pass
+            except IntegrityError:
+                db.rollback()
+                logger.info("Duplicate earthquake record ignored", extra={"pipeline": "earthquakes", "record_id": eq_no})
+            except Exception:
+                db.rollback()
+                logger.exception("Error saving earthquake record", extra={"pipeline": "earthquakes", "record_id": eq_no})
 
+    except coordination.NotLeaderError:
+        raise
     except Exception as e:
-        print(f"Error processing earthquakes: {e}")
+        logger.exception("Error processing earthquakes", extra={"pipeline": "earthquakes", "duration_ms": elapsed_ms(started)})
         return {"status": "error", "message": str(e)}
 
-    return {"status": "success", "new_earthquakes_processed": new_eq_count}
+    logger.info("Earthquake check complete", extra={
+        "pipeline": "earthquakes", "new": new_eq_count, "duration_ms": elapsed_ms(started)
+    })
+
+    return {"status": "success", "new_earthquakes_processed": new_eq_count, "max_magnitude": max_magnitude}
+
+# 5. 資料保存維護 (分區 / 封存 / 過期刪除)
+@app.post("/api/cron/maintenance")
+def run_maintenance(db: Session = Depends(get_db)):
+    """
+    每日執行：建立未來月份分區 -> 封存冷資料大型欄位 -> 刪除超過保存期限的分區
+    """
+    started = time.perf_counter()
+    try:
+        result = retention.run_maintenance(db)
+    except Exception as e:
+        db.rollback()
+        logger.exception("Error running maintenance", extra={"pipeline": "maintenance"})
+        return {"status": "error", "message": str(e)}
+    logger.info("Maintenance complete", extra={"pipeline": "maintenance", "duration_ms": elapsed_ms(started), **result})
+
+    return {"status": "success", **result}
+
+# 6. 儀表板：設定、最新預報與各歷史列表第一頁合併為一次回應
+# 依 limit 快取已編碼的內容與 ETag，任何資料寫入 (NOTIFY) 時清除
+dashboard_cache = {"entries": {}, "generation": 0}
+
+def invalidate_dashboard_cache():
+    dashboard_cache["entries"].clear()
+    dashboard_cache["generation"] += 1
+
+for _topic in HISTORY_LISTS:
+    coordination.on_invalidate(_topic, invalidate_dashboard_cache)
+
+# 列出的欄位含有封存欄位的列表；其他列表 (例如 forecasts 不列出 cities_data) 不需檢查 archived
+DASHBOARD_ARCHIVED_LISTS = {
+    name for name, (model, fields, _) in HISTORY_LISTS.items()
+    if set(fields) & set(retention.ARCHIVED_FIELDS.get(model, ()))
+}
+
+def _utc_z_sql(column: str) -> str:
+    """
+    時間欄位格式化為 orjson OPT_UTC_Z 的輸出 (UTC、"Z" 結尾、微秒為 0 時省略)；
+    json 直接輸出 timestamptz 會帶 session 時區的 offset (例如 "+08:00")
+    """
+    utc = f"({column} AT TIME ZONE 'UTC')"
+    return (
+        f"to_char({utc}, 'YYYY-MM-DD\"T\"HH24:MI:SS') || "
+        f"CASE WHEN date_part('microseconds', {utc})::bigint % 1000000 = 0 THEN '' ELSE to_char({utc}, '.US') END || 'Z'"
+    )
+
+def _dashboard_sql() -> str:
+    """
+    PostgreSQL：以單一查詢取得三個列表 (json_agg 後以文字輸出，不在 Python 端解析)
+    與最新一筆預報；另外回傳含有封存欄位的頁面是否有已封存的紀錄
+    """
+    ctes = []
+    columns = []
+    for name, (model, fields, order) in HISTORY_LISTS.items():
+        cols = ", ".join(fields)
+        archived = ", archived" if name in DASHBOARD_ARCHIVED_LISTS else ""
+        ctes.append(f"{name} AS (SELECT {cols}{archived} FROM {model.__tablename__} ORDER BY {order} DESC LIMIT :limit)")
+        # 依原始欄位排序 (格式化後的時間字串不能直接比較)
+        pairs = ", ".join(
+            f"'{f}', " + (_utc_z_sql(f) if isinstance(getattr(model, f).type, DateTime) else f) for f in fields
+        )
+        columns.append(
+            f"(SELECT coalesce(json_agg(json_build_object({pairs}) ORDER BY {order} DESC), '[]')::text FROM {name}) AS {name}"
+        )
+        if archived:
+            columns.append(f"(SELECT coalesce(bool_or(archived), false) FROM {name}) AS {name}_archived")
+    ctes.append(
+        "latest AS (SELECT id, archived, overview, cities_data, ai_report "
+        f"FROM {models.WeatherForecast.__tablename__} ORDER BY created_at DESC LIMIT 1)"
+    )
+    for field in ("id", "archived", "overview", "cities_data", "ai_report"):
+        columns.append(f"(SELECT {field} FROM latest) AS latest_{field}")
+    return f"WITH {', '.join(ctes)} SELECT {', '.join(columns)}"
+
+DASHBOARD_SQL = text(_dashboard_sql())
+
+def _history_page_json(db: Session, name: str, limit: int) -> bytes:
+    model, _, order = HISTORY_LISTS[name]
+    query = history_query(db, name).order_by(getattr(model, order).desc()).limit(limit)
+    return dumps(record_rows(db, query, model))
+
+def _dashboard_body(db: Session, limit: int) -> bytes:
+    pages = {}
+    weather = None
+    if db.get_bind().dialect.name == "postgresql":
+        weather_generation = weather_cache["generation"]
+        row = db.execute(DASHBOARD_SQL, {"limit": limit}).mappings().one()
+        for name in HISTORY_LISTS:
+            # 含有已封存紀錄的頁面需還原大型欄位，改走一般查詢
+            archived = name in DASHBOARD_ARCHIVED_LISTS and row[f"{name}_archived"]
+            pages[name] = _history_page_json(db, name, limit) if archived else row[name].encode("utf-8")
+        if row["latest_id"] is not None:
+            weather = latest_forecast_json(db, {
+                field: row[f"latest_{field}"] for field in ("id", "archived", "overview", "cities_data", "ai_report")
+            }, weather_generation)
+    else:
+        for name in HISTORY_LISTS:
+            pages[name] = _history_page_json(db, name, limit)
+        weather = latest_weather_json(db)
+
+    parts = [b'{"config":', dumps(get_config()), b',"weather":', weather or b"null"]
+    for name, page in pages.items():
+        parts += [b',"', name.encode(), b'":', page]
+    parts.append(b"}")
+    return b"".join(parts)
+
+@app.get("/api/dashboard")
+def get_dashboard(request: Request, limit: int = Query(10, ge=1, le=100), db: Session = Depends(get_db)):
+    """
+    儀表板初始資料：config、最新預報 (weather，尚無資料時為 null) 與 forecasts / warnings / earthquakes 第一頁。
+    回應帶有 ETag，瀏覽器以 If-None-Match 重新驗證時，資料未變更則回傳 304。
+    """
+    # LISTEN 連線中斷時可能漏掉失效通知，此時不使用快取
+    cached = dashboard_cache["entries"].get(limit) if coordination.listener.healthy() else None
+    if cached is None:
+        generation = dashboard_cache["generation"]
+        body = _dashboard_body(db, limit)
+        cached = ('"%s"' % hashlib.sha1(body).hexdigest(), body)
+        if dashboard_cache["generation"] == generation:
+            dashboard_cache["entries"][limit] = cached
+    etag, body = cached
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return RawJSONResponse(body, headers=headers)
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,117 @@
+"""
+資料庫 Schema 版本管理
+
+每個 migration 只會執行一次，已套用的版本記錄在 schema_migrations。
+多個 replica 同時啟動時以 PostgreSQL advisory lock 確保同一時間只有一個在執行。
+新增資料表 / 欄位時，請在 MIGRATIONS 尾端加上新的版本，不要修改已發布的 migration。
+
+既有的資料庫 (schema_migrations 出現前由 create_all 建立) 也能直接套用：
+建表皆為 checkfirst，分區轉換只會處理尚未分區的舊表。
+"""
+import logging
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import inspect, select, text
+
+from database import engine
+import models
+import retention
+
+MIGRATION_LOCK_KEY = 7_203_301 # pg_advisory_lock 的 key，任意但固定
+DB_RETRY_MAX_DELAY = 10.0 # 連線重試的最長間隔 (秒)
+
+logger = logging.getLogger(__name__)
+
+def _create_tables(*tables) -> Callable[[], None]:
+    def migrate():
+        models.Base.metadata.create_all(bind=engine, tables=[m.__table__ for m in tables])
+    return migrate
+
+def _add_column(model, column_name: str) -> Callable[[], None]:
+    def migrate():
+        table = model.__table__
+        if column_name in {c["name"] for c in inspect(engine).get_columns(table.name)}:
+            return
+        column_type = table.c[column_name].type.compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column_name}" {column_type}'))
+    return migrate
+
+def _create_earthquake_numbers():
+    """建立地震編號表，並由既有的地震紀錄回填"""
+    numbers = models.EarthquakeNumber.__table__
+    numbers.create(bind=engine, checkfirst=True)
+    alerts = models.EarthquakeAlert.__table__
+    with engine.begin() as conn:
+        known = select(numbers.c.earthquake_no)
+        conn.execute(numbers.insert().from_select(
+            ["earthquake_no"],
+            select(alerts.c.earthquake_no).distinct().where(
+                alerts.c.earthquake_no.isnot(None), alerts.c.earthquake_no.not_in(known)
+            )
+        ))
+
+MIGRATIONS: List[Tuple[int, str, Callable[[], None]]] = [
+    (1, "create_history_tables", lambda: retention.create_history_tables(engine)),
+    (2, "partition_history_tables", lambda: retention.prepare_schema(engine)),
+    (3, "create_archived_payloads", _create_tables(models.ArchivedPayload)),
+    (4, "create_regeneration_jobs", _create_tables(models.RegenerationJob)),
+    (5, "create_forecast_drafts", _create_tables(models.ForecastDraft)),
+    (6, "create_leader_leases", _create_tables(models.LeaderLease)),
+    (7, "add_regeneration_failed_ids", _add_column(models.RegenerationJob, "failed_ids")),
+    (8, "create_earthquake_numbers", _create_earthquake_numbers),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# 供 /health/ready 回報
+state = {"status": "pending", "version": None, "latest": LATEST_VERSION, "error": None}
+
+def wait_for_database(stop: Optional[threading.Event] = None) -> bool:
+    """
+    等待資料庫可以連線 (exponential backoff，不設次數上限)。
+    在 thread 中執行，無法被 task.cancel() 中斷：關閉服務時 set stop 讓迴圈結束，此時回傳 False
+    """
+    stop = stop or threading.Event()
+    delay = 0.5
+    while not stop.is_set():
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            state["status"] = "waiting_for_database"
+            state["error"] = str(e).splitlines()[0]
+            logger.warning("Database not available (%s), retrying in %.1fs", state["error"], delay)
+            stop.wait(delay)
+            delay = min(delay * 2, DB_RETRY_MAX_DELAY)
+    return False
+
+def run_migrations():
+    """依序套用尚未執行的 migration"""
+    state.update(status="migrating", error=None)
+    is_postgres = engine.dialect.name == "postgresql"
+    with engine.connect() as lock_conn:
+        if is_postgres:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            models.SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+            with engine.connect() as conn:
+                applied = set(conn.execute(select(models.SchemaMigration.version)).scalars())
+
+            for version, name, migrate in MIGRATIONS:
+                if version in applied:
+                    continue
+                logger.info("Applying schema migration %s: %s", version, name, extra={"version": version})
+                migrate()
+                with engine.begin() as conn:
+                    conn.execute(models.SchemaMigration.__table__.insert().values(version=version, name=name))
+                applied.add(version)
+        except Exception as e:
+            state.update(status="failed", error=str(e))
+            raise
+        finally:
+            if is_postgres:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+    state.update(status="done", version=max(applied))
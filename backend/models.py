@@ -1,9 +1,21 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, LargeBinary, UniqueConstraint
+from sqlalchemy.sql import func, expression
+from datetime import datetime, timezone
 from database import Base
 
+# 三張歷史資料表皆依 created_at 以「月」為單位做 Range Partition (僅 PostgreSQL 生效)。
+# Model 的 PK 只有 id (SQLite 等其他資料庫照常建表)；PostgreSQL 的分區表 PK 必須包含 partition key，
+# 實際建表時由 retention.partitioned_table() 改為 (id, created_at)。
+# created_at 由 Python 端給值，INSERT 時一定落在正確的分區。
+# 分區的建立 / 過期刪除 / 冷資料封存請見 retention.py
+PARTITION_ARGS = {"postgresql_partition_by": "RANGE (created_at)"}
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
 class WeatherWarning(Base):
     __tablename__ = "weather_warnings"
+    __table_args__ = PARTITION_ARGS
 
     id = Column(Integer, primary_key=True, index=True)
     dataset_id = Column(String, index=True) # e.g., W-C0033-002
@@ -14,14 +26,17 @@ class WeatherWarning(Base):
     
     ai_report = Column(Text, nullable=True) # 儲存 AI 生成的廣播稿
     is_reported = Column(Boolean, default=False) # 是否已播報過
+    archived = Column(Boolean, server_default=expression.false()) # 大型文字欄位是否已移至 archived_payloads
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow, server_default=func.now())
 
 class EarthquakeAlert(Base):
     __tablename__ = "earthquake_alerts"
+    __table_args__ = PARTITION_ARGS
 
     id = Column(Integer, primary_key=True, index=True)
-    earthquake_no = Column(Integer, unique=True, index=True) # e.g. 115003
+    # 分區表無法建立不含 partition key 的 UNIQUE，唯一性由 earthquake_numbers 保證
+    earthquake_no = Column(Integer, index=True) # e.g. 115003
     report_type = Column(String) # e.g. "地震報告"
     origin_time = Column(String) # e.g. "2026-01-12 21:31:49"
     location = Column(String) # e.g. "宜蘭縣政府東方 24.9 公里"
@@ -34,10 +49,19 @@ class EarthquakeAlert(Base):
     
     ai_report = Column(Text, nullable=True)
     is_reported = Column(Boolean, default=False)
+    archived = Column(Boolean, server_default=expression.false())
+    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow, server_default=func.now())
+
+class EarthquakeNumber(Base):
+    """已處理過的地震編號 (未分區)，與 earthquake_alerts 在同一個交易寫入，重複的地震會觸發 IntegrityError"""
+    __tablename__ = "earthquake_numbers"
+
+    earthquake_no = Column(Integer, primary_key=True, autoincrement=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class WeatherForecast(Base):
     __tablename__ = "weather_forecasts"
+    __table_args__ = PARTITION_ARGS
 
     id = Column(Integer, primary_key=True, index=True)
     report_time = Column(DateTime(timezone=True), server_default=func.now()) # 呼叫 API 的時間
@@ -49,6 +73,71 @@ class WeatherForecast(Base):
     cities_data = Column(Text) # JSON string of city data
     
     ai_report = Column(Text, nullable=True)
+    archived = Column(Boolean, server_default=expression.false())
+    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow, server_default=func.now())
+
+class ArchivedPayload(Base):
+    """冷資料的大型文字欄位 (壓縮後)，讀取時由 retention.hydrate 還原"""
+    __tablename__ = "archived_payloads"
+    __table_args__ = (UniqueConstraint("source_table", "record_id", name="uq_archived_payloads_source"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_table = Column(String, index=True) # e.g. weather_forecasts
+    record_id = Column(Integer, index=True)
+    record_created_at = Column(DateTime(timezone=True), index=True) # 原始資料的 created_at，用於過期刪除
+    codec = Column(String) # gzip / zstd
+    payload = Column(LargeBinary) # 壓縮後的 JSON: {"欄位": "內容", ...}
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class RegenerationJob(Base):
+    """批次重新生成 AI 報告的工作進度 (可中斷後從 cursor 繼續)"""
+    __tablename__ = "regeneration_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    record_type = Column(String) # warnings / earthquakes / forecasts
+    start_date = Column(Date, nullable=True) # created_at 篩選範圍 (包含當天)
+    end_date = Column(Date, nullable=True)
+    status = Column(String, default="pending") # pending / running / completed / completed_with_errors / failed / cancelled / interrupted
+
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    failed_ids = Column(Text, nullable=True) # 失敗紀錄的 id (JSON list)，resume 時重試
+
+    # Keyset cursor：最後一筆已處理紀錄的 (created_at, id)
+    cursor_created_at = Column(DateTime(timezone=True), nullable=True)
+    cursor_id = Column(Integer, nullable=True)
+
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ForecastDraft(Base):
+    """整點預報的預先生成稿 (整點前先生成，整點時只做輕量驗證後直接播報)"""
+    __tablename__ = "forecast_drafts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    target_hour = Column(DateTime(timezone=True), unique=True, index=True) # 預計播報的整點
+    overview = Column(Text, nullable=True)
+    cities_data = Column(Text) # 生成當下的縣市資料 (JSON)，整點時與最新資料比對
+    ai_report = Column(Text, nullable=True)
+    published_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class LeaderLease(Base):
+    """多個 Backend replica 的 leader 租約 (見 coordination.py)"""
+    __tablename__ = "leader_leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String) # 持有者的 INSTANCE_ID
+    holder_url = Column(String) # follower 轉送請求的位址
+    expires_at = Column(DateTime(timezone=True))
+    renewed_at = Column(DateTime(timezone=True))
+
+class SchemaMigration(Base):
+    """已套用的 schema migration 版本 (見 migrations.py)"""
+    __tablename__ = "schema_migrations"
 
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,124 @@
+"""
+排程器的自適應輪詢 (地震 E-A0015-001 / 特報 W-C0033-002)
+
+- 有顯著地震或新特報時，在 hot window 內改用短間隔 (例如 10 秒) 輪詢
+- 連續多次沒有新事件時逐步拉長間隔 (backoff)，直到上限
+- 每次間隔加上隨機 jitter，避免與其他服務同時打 CWA
+
+CWA 的請求速率由 Backend 的 cwa.py (全域 token bucket，保留額度給地震) 統一限制，這裡不另外計算預算
+"""
+import os
+import json
+import random
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+POLL_JITTER = float(os.getenv("POLL_JITTER", "0.1")) # ±10%
+POLL_BACKOFF_FACTOR = float(os.getenv("POLL_BACKOFF_FACTOR", "1.5"))
+POLL_QUIET_RUNS = int(os.getenv("POLL_QUIET_RUNS", "10")) # 連續幾次沒有新事件後開始 backoff
+
+class AdaptiveFeed:
+    """單一資料來源的輪詢節奏"""
+
+    def __init__(self, name: str, base_interval: float, hot_interval: float, max_interval: float,
+                 hot_window: float):
+        self.name = name
+        self.base_interval = base_interval
+        self.hot_interval = hot_interval
+        self.max_interval = max_interval
+        self.hot_window = hot_window # 秒
+
+        self.interval = base_interval
+        self.mode = "normal" # normal / hot / backoff
+        self.hot_until: Optional[datetime] = None
+        self.quiet_runs = 0
+        self.last_run: Optional[datetime] = None
+        self.next_run: Optional[datetime] = None
+
+    def record(self, new_records: int, hot: bool = False):
+        """
+        依照本次輪詢結果調整下一次的間隔：
+        new_records 為新紀錄筆數 (有新紀錄就不算安靜，不會 backoff)，hot 為是否觸發 hot window
+        (例如地震達到 EQ_HOT_MIN_MAGNITUDE)
+        """
+        now = datetime.now()
+        self.last_run = now
+        if hot:
+            self.hot_until = now + timedelta(seconds=self.hot_window)
+        if new_records or hot:
+            self.quiet_runs = 0
+
+        if self.hot_until and now < self.hot_until:
+            self.mode = "hot"
+            self.interval = self.hot_interval
+            return
+
+        self.hot_until = None
+        if not new_records:
+            self.quiet_runs += 1
+        if self.quiet_runs > POLL_QUIET_RUNS:
+            self.mode = "backoff"
+            self.interval = min(max(self.interval, self.base_interval) * POLL_BACKOFF_FACTOR, self.max_interval)
+        else:
+            self.mode = "normal"
+            self.interval = self.base_interval
+
+    def next_delay(self) -> float:
+        return self.interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+    def snapshot(self) -> dict:
+        return {
+            "mode": self.mode,
+            "interval_seconds": round(self.interval, 1),
+            "hot_until": self.hot_until.isoformat() if self.hot_until else None,
+            "quiet_runs": self.quiet_runs,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "next_run": self.next_run.isoformat() if self.next_run else None,
+        }
+
+def start_status_server(host: str, port: int, feeds: Dict[str, AdaptiveFeed], profiles=None):
+    """
+    在背景執行緒提供 GET /cadence，回傳各 feed 目前的輪詢節奏；
+    啟用 job 效能分析 (profiles 為 profiling.ProfileStore) 時另提供 GET /profiles 與 /profiles/{id}?format=
+    """
+
+    class CadenceHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            path = url.path.rstrip("/")
+            if path == "/cadence":
+                self._send(200, "application/json", json.dumps({
+                    "feeds": {name: feed.snapshot() for name, feed in feeds.items()},
+                }, ensure_ascii=False))
+            elif profiles is not None and path == "/profiles":
+                self._send(200, "application/json", json.dumps({
+                    "keep": profiles.keep, "recorded": profiles.recorded, "profiles": profiles.list()
+                }, ensure_ascii=False))
+            elif profiles is not None and path.startswith("/profiles/") and path[len("/profiles/"):].isdigit():
+                import profiling
+                found = profiles.get(int(path[len("/profiles/"):]))
+                format = parse_qs(url.query).get("format", ["html"])[0]
+                if not found or format not in profiling.FORMATS:
+                    self.send_error(404)
+                    return
+                self._send(200, *reversed(profiling.render(found[1], format)))
+            else:
+                self.send_error(404)
+
+        def _send(self, status: int, content_type: str, text: str):
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # 不輸出每次請求的 access log
+
+    server = ThreadingHTTPServer((host, port), CadenceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
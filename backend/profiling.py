@@ -0,0 +1,226 @@
+"""
+按需效能分析 (pyinstrument)
+
+- 單次請求：PROFILING_ENABLED=1 時，任一路由加上 ?profile=1 (或 header X-Profile: 1) 即以取樣 profiler 執行，
+  回傳 pyinstrument 報告取代原本的回應；?profile=text / speedscope 可改為文字或 speedscope JSON。
+- Cron 端點：PROFILE_CRON=1 時，每次 POST /api/cron/* 都以較粗的取樣間隔記錄，只保留最慢的 PROFILE_KEEP 次，
+  可由 GET /debug/profiles 查看。
+- 排程器：PROFILE_JOBS=all 或以逗號分隔的 job 名稱 (例如 job_check_earthquakes)，保留方式相同，
+  由排程器的 GET http://localhost:8001/profiles 查看。
+
+以上皆未啟用時不會安裝 middleware / 包裝 job，也不會 import pyinstrument。
+同步 (def) 路由在 threadpool 中執行，單次請求的報告只會看到等待 threadpool 的時間；async 路由 (含 cron 端點) 則完整。
+"""
+import os
+import time
+import heapq
+import logging
+import functools
+import itertools
+import threading
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+PROFILE_CRON = os.getenv("PROFILE_CRON", "0").lower() in ("1", "true", "yes")
+PROFILE_JOBS = os.getenv("PROFILE_JOBS", "")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "10"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001")) # 單次請求的取樣間隔 (秒)
+PROFILE_CRON_INTERVAL = float(os.getenv("PROFILE_CRON_INTERVAL", "0.01")) # cron / job 的取樣間隔，較粗以降低負擔
+
+CRON_PATH_PREFIX = "/api/cron/"
+
+# format -> (pyinstrument renderer 名稱, media type)
+FORMATS = {
+    "html": ("HTMLRenderer", "text/html; charset=utf-8"),
+    "text": ("ConsoleRenderer", "text/plain; charset=utf-8"),
+    "speedscope": ("SpeedscopeRenderer", "application/json"),
+}
+
+logger = logging.getLogger(__name__)
+
+def available() -> bool:
+    try:
+        import pyinstrument  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def start_profiler(interval: float):
+    from pyinstrument import Profiler
+    profiler = Profiler(interval=interval, async_mode="enabled")
+    profiler.start()
+    return profiler
+
+def render(session, format: str = "html") -> Tuple[str, str]:
+    """回傳 (報告內容, media type)"""
+    from pyinstrument import renderers
+    renderer_name, media_type = FORMATS[format]
+    renderer_cls = getattr(renderers, renderer_name)
+    renderer = renderer_cls(unicode=True) if renderer_name == "ConsoleRenderer" else renderer_cls()
+    return renderer.render(session), media_type
+
+class ProfileStore:
+    """只保留最慢的 keep 筆 profile (thread-safe)"""
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.keep = keep
+        self._heap: List[tuple] = [] # (duration, id, meta, session)，heap 頂端為最快的一筆
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def add(self, name: str, duration: float, session, **meta):
+        entry = {
+            "name": name,
+            "duration_ms": round(duration * 1000, 1),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            **meta,
+        }
+        with self._lock:
+            self.recorded += 1
+            item = (duration, next(self._ids), entry, session)
+            if len(self._heap) < self.keep:
+                heapq.heappush(self._heap, item)
+            elif duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            items = sorted(self._heap, key=lambda x: x[0], reverse=True)
+        return [{"id": profile_id, **entry} for _, profile_id, entry, _ in items]
+
+    def get(self, profile_id: int):
+        with self._lock:
+            for _, pid, entry, session in self._heap:
+                if pid == profile_id:
+                    return entry, session
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+
+cron_profiles = ProfileStore()
+
+def _requested_format(scope) -> Optional[str]:
+    """?profile=1|html|text|speedscope 或 X-Profile header，未要求時回傳 None"""
+    value = None
+    for key, val in scope["headers"]:
+        if key == b"x-profile":
+            value = val.decode("latin-1")
+            break
+    query = scope.get("query_string", b"")
+    if value is None and b"profile=" in query:
+        from urllib.parse import parse_qs
+        value = parse_qs(query.decode("latin-1")).get("profile", [None])[0]
+    if not value or value.lower() in ("0", "false", "no"):
+        return None
+    return value.lower() if value.lower() in FORMATS else "html"
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware (不用 BaseHTTPMiddleware，async 路由才會和 profiler 在同一個 task 中執行)。
+    只在 PROFILING_ENABLED / PROFILE_CRON 啟用時由 main.py 安裝。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        format = _requested_format(scope) if PROFILING_ENABLED else None
+        if format is not None:
+            await self._profile_request(scope, receive, send, format)
+        elif PROFILE_CRON and scope["method"] == "POST" and scope["path"].startswith(CRON_PATH_PREFIX):
+            await self._sample_cron(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def _profile_request(self, scope, receive, send, format: str):
+        if not available():
+            await Response("伺服器未安裝 pyinstrument，無法進行效能分析", status_code=501)(scope, receive, send)
+            return
+
+        status = {}
+        async def discard(message):
+            # 原本的回應改以 header 附上狀態碼，內容換成報告
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+
+        profiler = start_profiler(PROFILE_INTERVAL)
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            session = profiler.stop()
+        body, media_type = render(session, format)
+        headers = {"X-Profiled-Status": str(status.get("code", "")), "Cache-Control": "no-store"}
+        await Response(body, media_type=media_type, headers=headers)(scope, receive, send)
+
+    async def _sample_cron(self, scope, receive, send):
+        if not available():
+            await self.app(scope, receive, send)
+            return
+
+        status = {}
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        profiler = start_profiler(PROFILE_CRON_INTERVAL)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session = profiler.stop()
+            cron_profiles.add(scope["path"], time.perf_counter() - started, session, status=status.get("code"))
+
+# --- 查看保留的 profile (只在啟用時由 main.py 掛上) ---
+
+router = APIRouter()
+
+@router.get("/debug/profiles")
+def list_profiles():
+    """最慢的 cron 執行紀錄 (由慢到快)"""
+    return {"keep": cron_profiles.keep, "recorded": cron_profiles.recorded, "profiles": cron_profiles.list()}
+
+@router.get("/debug/profiles/{profile_id}")
+def get_profile(profile_id: int, format: str = "html"):
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format 需為 {', '.join(FORMATS)}")
+    found = cron_profiles.get(profile_id)
+    if not found:
+        raise HTTPException(status_code=404, detail="找不到該 profile (可能已被較慢的紀錄取代)")
+    body, media_type = render(found[1], format)
+    return Response(body, media_type=media_type)
+
+@router.delete("/debug/profiles")
+def clear_profiles():
+    cron_profiles.clear()
+    return {"status": "success"}
+
+# --- 排程器 job ---
+
+def job_profiling_targets() -> set:
+    """PROFILE_JOBS 指定要分析的 job 名稱，"all" 代表所有 job_*"""
+    return {name.strip() for name in PROFILE_JOBS.split(",") if name.strip()}
+
+def profile_job(func: Callable, store: ProfileStore) -> Callable:
+    """包裝排程器的 job：以取樣 profiler 執行並保留最慢的幾次"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        profiler = start_profiler(PROFILE_CRON_INTERVAL)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            session = profiler.stop()
+            store.add(func.__name__, time.perf_counter() - started, session)
+    return wrapper
@@ -0,0 +1,369 @@
+"""
+批次重新生成歷史紀錄的 AI 報告 (不經過 TTS)
+
+依類型與日期範圍 (created_at) 挑選紀錄，以 keyset cursor 逐批讀取；
+每批的 LLM 呼叫在 Semaphore 與 Provider 速率限制下並行執行，結果以 bulk update 寫回，
+同時把 cursor 存進 regeneration_jobs，服務中斷重啟後會自動從上次的位置繼續。
+失敗的紀錄 id 存在 failed_ids (狀態為 completed_with_errors)，resume 時會重試。
+"""
+import os
+import json
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import APIRouter, HTTPException, Depends
+from pydantic import BaseModel
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, get_db
+import models
+import retention
+import prompts
+import llm
+import coordination
+
+router = APIRouter()
+
+REGEN_BATCH_SIZE = int(os.getenv("REGEN_BATCH_SIZE", "50"))
+REGEN_CONCURRENCY = int(os.getenv("REGEN_CONCURRENCY", "4"))
+REGEN_MAX_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+REGEN_MODELS = {
+    "warnings": models.WeatherWarning,
+    "earthquakes": models.EarthquakeAlert,
+    "forecasts": models.WeatherForecast,
+}
+
+# 目前在此 process 執行中的工作
+_tasks: Dict[int, asyncio.Task] = {}
+
+class RegenerationRequest(BaseModel):
+    record_type: str # warnings / earthquakes / forecasts
+    start: Optional[date] = None
+    end: Optional[date] = None
+
+class RegenerationStatus(BaseModel):
+    id: int
+    record_type: str
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    status: str
+    total: int
+    processed: int
+    failed: int
+    failed_ids: List[int] = []
+    progress: float
+    running: bool
+    last_error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+def _to_status(job: models.RegenerationJob) -> RegenerationStatus:
+    task = _tasks.get(job.id)
+    return RegenerationStatus(
+        id=job.id,
+        record_type=job.record_type,
+        start_date=job.start_date,
+        end_date=job.end_date,
+        status=job.status,
+        total=job.total or 0,
+        processed=job.processed or 0,
+        failed=job.failed or 0,
+        failed_ids=_failed_ids(job),
+        progress=round((job.processed or 0) / job.total, 4) if job.total else 1.0,
+        running=task is not None and not task.done(),
+        last_error=job.last_error,
+        created_at=job.created_at,
+        updated_at=job.updated_at
+    )
+
+def _filtered_query(db: Session, model, job: models.RegenerationJob):
+    query = db.query(model)
+    if job.start_date:
+        query = query.filter(model.created_at >= job.start_date)
+    if job.end_date:
+        query = query.filter(model.created_at < job.end_date + timedelta(days=1))
+    return query
+
+def _next_batch(db: Session, model, job: models.RegenerationJob) -> List:
+    query = _filtered_query(db, model, job)
+    if job.cursor_created_at is not None:
+        query = query.filter(tuple_(model.created_at, model.id) > tuple_(job.cursor_created_at, job.cursor_id))
+    return query.order_by(model.created_at, model.id).limit(REGEN_BATCH_SIZE).all()
+
+async def _in_thread(func, *args):
+    """
+    在 thread 中執行 DB 操作，長時間的工作不會卡住 event loop (API 與 leader 續約)。
+    thread 無法中斷：工作被取消時先等它結束，同一個 Session 才不會同時被兩個 thread 使用
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait({future})
+        raise
+
+def _start_job(db: Session, job_id: int) -> models.RegenerationJob:
+    job = db.query(models.RegenerationJob).filter(models.RegenerationJob.id == job_id).first()
+    job.status = "running"
+    db.commit()
+    return job
+
+def _job_status(db: Session, job: models.RegenerationJob) -> str:
+    db.refresh(job)
+    return job.status
+
+def _load_records(db: Session, model, job: models.RegenerationJob, ids: Optional[List[int]] = None) -> List:
+    """cursor 之後的下一批 (或指定 id 的) 紀錄，並還原封存欄位；生成期間不會再觸發查詢"""
+    if ids is None:
+        records = _next_batch(db, model, job)
+    else:
+        records = db.query(model).filter(model.id.in_(ids)).all()
+    return retention.hydrate(db, records)
+
+def _write_results(db: Session, model, record_type: str, mappings: List[dict]):
+    db.bulk_update_mappings(model, mappings)
+    coordination.notify(db, record_type)
+
+def _mark_job(db: Session, job: models.RegenerationJob, status: str, error: Optional[str] = None):
+    db.rollback()
+    job.status = status
+    if error is not None:
+        job.last_error = error
+    db.commit()
+
+def _build_prompt(record_type: str, record):
+    """回傳 (system_prompt, user_prompt)，與手動重新播報使用相同的 Prompt"""
+    if record_type == "warnings":
+        return prompts.WARNING_REREPORT_SYSTEM_PROMPT, prompts.warning_user_prompt(
+            record.title, record.issue_time, record.affected_areas, record.content
+        )
+    if record_type == "earthquakes":
+        return prompts.EARTHQUAKE_REREPORT_SYSTEM_PROMPT, prompts.earthquake_user_prompt(
+            record.earthquake_no, record.origin_time, record.magnitude, record.depth,
+            record.location, record.intensity_summary, record.content
+        )
+    cities = json.loads(record.cities_data or "[]")
+    return prompts.FORECAST_SYSTEM_PROMPT, prompts.forecast_user_prompt(cities)
+
+async def _regenerate_one(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, system_prompt: str, user_prompt: str) -> str:
+    async with semaphore:
+        for attempt in range(1, REGEN_MAX_ATTEMPTS + 1):
+            await llm.rate_limiter().acquire()
+            try:
+                return await llm.complete(system_prompt, user_prompt, client)
+            except llm.AIConfigError:
+                raise
+            except Exception:
+                if attempt == REGEN_MAX_ATTEMPTS:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+
+def _failed_ids(job: models.RegenerationJob) -> List[int]:
+    return json.loads(job.failed_ids) if job.failed_ids else []
+
+def _set_failed_ids(job: models.RegenerationJob, ids: List[int]):
+    job.failed_ids = json.dumps(sorted(ids)) if ids else None
+    job.failed = len(ids)
+
+async def _regenerate_batch(db: Session, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, model,
+                            job: models.RegenerationJob, records: List) -> List[int]:
+    """重新生成一批 (已還原封存欄位的) 紀錄並 bulk update (尚未 commit)，回傳失敗紀錄的 id"""
+    results = await asyncio.gather(
+        *[_regenerate_one(client, semaphore, *_build_prompt(job.record_type, r)) for r in records],
+        return_exceptions=True
+    )
+
+    mappings = []
+    failed_ids = []
+    for record, result in zip(records, results):
+        if isinstance(result, llm.AIConfigError):
+            raise result
+        if isinstance(result, Exception):
+            failed_ids.append(record.id)
+            job.last_error = f"ID {record.id}: {result}"
+            continue
+        # 只更新 ai_report (不帶 created_at，否則會一併 SET partition key)
+        mappings.append({"id": record.id, "ai_report": result})
+
+    await _in_thread(_write_results, db, model, job.record_type, mappings)
+    return failed_ids
+
+async def run_job(job_id: int):
+    """
+    依 cursor 處理範圍內的紀錄；失敗的紀錄 id 記在 failed_ids，cursor 照常前進。
+    工作開始時已存在的 failed_ids (先前執行失敗的紀錄) 會在 cursor 走完後重試一次。
+    DB 操作都在 thread 中執行；commit 後不 expire，event loop 上讀取 job 欄位不會觸發查詢。
+    """
+    db = SessionLocal(expire_on_commit=False)
+    job = None
+    try:
+        job = await _in_thread(_start_job, db, job_id)
+        model = REGEN_MODELS[job.record_type]
+        retry_ids = _failed_ids(job)
+        logger.info("Regeneration job started", extra={
+            "pipeline": "regenerate", "job_id": job_id, "record_type": job.record_type,
+            "processed": job.processed, "total": job.total, "retry": len(retry_ids)
+        })
+
+        semaphore = asyncio.Semaphore(REGEN_CONCURRENCY)
+        async with httpx.AsyncClient() as client:
+            while True:
+                if await _in_thread(_job_status, db, job) != "running": # 已被取消
+                    break
+
+                records = await _in_thread(_load_records, db, model, job)
+                if records:
+                    failed_ids = await _regenerate_batch(db, client, semaphore, model, job, records)
+                    # 寫回結果、失敗清單與 cursor 在同一個 transaction，確保中斷後不會重複或漏掉
+                    _set_failed_ids(job, set(_failed_ids(job)) | set(failed_ids))
+                    job.processed += len(records)
+                    job.cursor_created_at = records[-1].created_at
+                    job.cursor_id = records[-1].id
+                elif retry_ids:
+                    batch_ids, retry_ids = retry_ids[:REGEN_BATCH_SIZE], retry_ids[REGEN_BATCH_SIZE:]
+                    records = await _in_thread(_load_records, db, model, job, batch_ids)
+                    failed_ids = await _regenerate_batch(db, client, semaphore, model, job, records)
+                    # 已不存在 (例如分區過期被刪除) 的紀錄不再重試
+                    succeeded = set(batch_ids) - set(failed_ids)
+                    _set_failed_ids(job, set(_failed_ids(job)) - succeeded)
+                else:
+                    job.status = "completed_with_errors" if job.failed_ids else "completed"
+                    coordination.ensure_leader()
+                    await _in_thread(db.commit)
+                    break
+
+                coordination.ensure_leader()
+                await _in_thread(db.commit)
+                logger.info("Regeneration job progress", extra={
+                    "pipeline": "regenerate", "job_id": job_id, "processed": job.processed,
+                    "total": job.total, "failed": job.failed
+                })
+
+        logger.info("Regeneration job finished", extra={
+            "pipeline": "regenerate", "job_id": job_id, "status": job.status, "failed": job.failed
+        })
+    except coordination.NotLeaderError:
+        # 已交接：放棄這一批，狀態維持 running 由新的 leader 從 cursor 繼續
+        logger.warning("Lost leadership, regeneration job handed over", extra={"pipeline": "regenerate", "job_id": job_id})
+        await _in_thread(db.rollback)
+    except asyncio.CancelledError:
+        # 服務關閉中，下次啟動時繼續；已卸任時工作可能已由新的 leader 接手，不改寫狀態
+        if job is not None and coordination.elector.is_leader:
+            await _in_thread(_mark_job, db, job, "interrupted")
+        raise
+    except Exception as e:
+        logger.exception("Regeneration job failed", extra={"pipeline": "regenerate", "job_id": job_id})
+        if job is not None:
+            await _in_thread(_mark_job, db, job, "failed", str(e))
+    finally:
+        await _in_thread(db.close)
+        _tasks.pop(job_id, None)
+
+def start_job(job_id: int):
+    task = _tasks.get(job_id)
+    if task is not None and not task.done():
+        return
+    _tasks[job_id] = asyncio.create_task(run_job(job_id))
+
+def _unfinished_job_ids() -> List[int]:
+    db = SessionLocal()
+    try:
+        return [j.id for j in db.query(models.RegenerationJob.id).filter(
+            models.RegenerationJob.status.in_(["pending", "running", "interrupted"])
+        ).all()]
+    finally:
+        db.close()
+
+async def resume_interrupted_jobs():
+    """服務啟動時，繼續上次未完成 (pending / running / interrupted) 的工作"""
+    for job_id in await asyncio.to_thread(_unfinished_job_ids):
+        logger.info("Resuming regeneration job", extra={"pipeline": "regenerate", "job_id": job_id})
+        start_job(job_id)
+
+async def stop_running_jobs():
+    """服務關閉或卸任時中斷執行中的工作 (仍是 leader 時狀態會記為 interrupted)"""
+    tasks = [t for t in _tasks.values() if not t.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+# --- API Endpoints ---
+
+@router.post("/api/regenerate", response_model=RegenerationStatus)
+async def create_regeneration_job(request: RegenerationRequest, db: Session = Depends(get_db)):
+    """
+    建立批次重新生成工作：依類型與日期範圍重新生成 ai_report (不播報)
+    """
+    model = REGEN_MODELS.get(request.record_type)
+    if model is None:
+        raise HTTPException(status_code=400, detail="record_type 僅支援 warnings / earthquakes / forecasts")
+
+    job = models.RegenerationJob(
+        record_type=request.record_type,
+        start_date=request.start,
+        end_date=request.end,
+        status="pending",
+        processed=0,
+        failed=0
+    )
+    # 計算範圍內的筆數可能掃過整個日期範圍，在 thread 中執行
+    await asyncio.to_thread(_save_new_job, db, model, job)
+
+    start_job(job.id)
+    return _to_status(job)
+
+def _save_new_job(db: Session, model, job: models.RegenerationJob):
+    job.total = _filtered_query(db, model, job).count()
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+@router.get("/api/regenerate", response_model=List[RegenerationStatus])
+def list_regeneration_jobs(limit: int = 20, db: Session = Depends(get_db)):
+    jobs = db.query(models.RegenerationJob).order_by(models.RegenerationJob.id.desc()).limit(limit).all()
+    return [_to_status(j) for j in jobs]
+
+@router.get("/api/regenerate/{job_id}", response_model=RegenerationStatus)
+def get_regeneration_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(models.RegenerationJob).filter(models.RegenerationJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="找不到該工作 ID")
+    return _to_status(job)
+
+@router.post("/api/regenerate/{job_id}/resume", response_model=RegenerationStatus)
+async def resume_regeneration_job(job_id: int, db: Session = Depends(get_db)):
+    """從上次的 cursor 繼續 failed / cancelled / interrupted 的工作，並重試先前失敗的紀錄 (含 completed_with_errors)"""
+    job = await asyncio.to_thread(_mark_pending, db, job_id)
+    start_job(job.id)
+    return _to_status(job)
+
+def _mark_pending(db: Session, job_id: int) -> models.RegenerationJob:
+    job = db.query(models.RegenerationJob).filter(models.RegenerationJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="找不到該工作 ID")
+    if job.status == "completed":
+        raise HTTPException(status_code=400, detail="該工作已完成")
+
+    if job.status != "running":
+        job.status = "pending"
+        db.commit()
+        db.refresh(job)
+    return job
+
+@router.post("/api/regenerate/{job_id}/cancel", response_model=RegenerationStatus)
+def cancel_regeneration_job(job_id: int, db: Session = Depends(get_db)):
+    """取消工作 (目前這一批處理完後停止，之後仍可 resume)"""
+    job = db.query(models.RegenerationJob).filter(models.RegenerationJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="找不到該工作 ID")
+    if job.status in ("pending", "running", "interrupted"):
+        job.status = "cancelled"
+        db.commit()
+    return _to_status(job)
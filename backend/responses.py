@@ -0,0 +1,36 @@
+"""
+以 orjson 輸出的 Response (列表 / 最新預報等高流量端點使用)
+
+FastAPI 內建的 ORJSONResponse 已標示為 deprecated，這裡自行實作。
+回傳這些 Response 時 FastAPI 不會再經過 response_model 驗證，
+端點上的 response_model 只用於產生 OpenAPI 文件。
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+
+def dumps(content: Any) -> bytes:
+    # OPT_UTC_Z：UTC 時間輸出為 "Z"，與 Pydantic 的輸出一致
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+class ORJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class RawJSONResponse(Response):
+    """內容已是編碼好的 JSON bytes，直接輸出"""
+    media_type = "application/json"
+
+def weather_json(overview: str, cities_json: str, ai_report: str) -> bytes:
+    """
+    組出 WeatherResponse 的 JSON：cities_data 在 DB 中已是 JSON 字串，直接嵌入而不解析再編碼
+    """
+    return b"".join((
+        b'{"overview":', orjson.dumps(overview or ""),
+        b',"cities":', (cities_json or "[]").encode("utf-8"),
+        b',"ai_report":', orjson.dumps(ai_report or ""),
+        b"}",
+    ))
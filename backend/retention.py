@@ -0,0 +1,326 @@
+"""
+資料保存策略 (Retention)
+
+- 月分區：weather_warnings / earthquake_alerts / weather_forecasts 依 created_at 每月一個分區，
+  另有一個 DEFAULT 分區承接尚未建立分區的月份。
+- 冷資料封存：超過 ARCHIVE_AFTER_DAYS 天的紀錄，其大型文字欄位會壓縮 (gzip / zstd) 後移至
+  archived_payloads，原表欄位清為 NULL 並標記 archived=True；歷史查詢時由 hydrate() 透明還原。
+  關鍵字搜尋會比對的欄位不封存，搜尋結果不受封存影響。
+- 過期刪除：RETENTION_MONTHS > 0 時，整個月份早於保存期限的分區會直接 DROP。
+
+分區相關操作僅在 PostgreSQL 上執行。
+"""
+import os
+import re
+import gzip
+import json
+import logging
+from datetime import datetime, date, timedelta, timezone
+from typing import Dict, List
+
+from sqlalchemy import MetaData, PrimaryKeyConstraint, text
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+import models
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90")) # 0 = 不封存
+RETENTION_MONTHS = int(os.getenv("RETENTION_MONTHS", "0")) # 0 = 永久保存
+ARCHIVE_CODEC = os.getenv("ARCHIVE_CODEC", "gzip").lower() # gzip 或 zstd (需安裝 zstandard)
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+PARTITION_MONTHS_AHEAD = 2 # 預先建立未來幾個月的分區
+
+logger = logging.getLogger(__name__)
+
+# 各表會被封存的大型欄位；歷史 API 關鍵字搜尋 (q) 會比對的欄位 (特報 / 地震的 content、預報的 ai_report)
+# 不封存，留在原表中才能繼續被搜尋到
+ARCHIVED_FIELDS = {
+    models.WeatherWarning: ("ai_report",),
+    models.EarthquakeAlert: ("intensity_summary", "ai_report"),
+    models.WeatherForecast: ("cities_data",),
+}
+
+# --- 壓縮 ---
+
+def _resolve_codec() -> str:
+    if ARCHIVE_CODEC == "zstd":
+        try:
+            import zstandard  # noqa: F401
+            return "zstd"
+        except ImportError:
+            logger.warning("ARCHIVE_CODEC=zstd but zstandard is not installed, falling back to gzip")
+    return "gzip"
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=9)
+
+def decompress(blob: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+# --- 分區管理 ---
+
+def _month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+def _add_months(d: date, n: int) -> date:
+    years, month_index = divmod(d.month - 1 + n, 12)
+    return date(d.year + years, month_index + 1, 1)
+
+def _bound(d: date) -> str:
+    return f"{d.isoformat()} 00:00:00+00"
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+def _is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+def partitioned_table(model):
+    """
+    PostgreSQL 分區表的 Table 定義：複製 model 的 Table，PK 改為 (id, created_at)
+    (分區表的 PK 必須包含 partition key)；model 本身維持單欄 PK，其他資料庫不受影響
+    """
+    table = model.__table__.to_metadata(MetaData())
+    table.c.id.autoincrement = True # 複合 PK 時需明確指定才會使用 SERIAL
+    table.c.created_at.primary_key = True
+    table.append_constraint(PrimaryKeyConstraint(table.c.id, table.c.created_at))
+    return table
+
+def create_history_tables(engine) -> None:
+    """建立三張歷史資料表 (已存在則略過)；PostgreSQL 直接建為分區表"""
+    if not _is_postgres(engine):
+        models.Base.metadata.create_all(bind=engine, tables=[m.__table__ for m in ARCHIVED_FIELDS])
+        return
+    with engine.begin() as conn:
+        for model in ARCHIVED_FIELDS:
+            partitioned_table(model).create(bind=conn, checkfirst=True)
+
+def _relkind(conn, name: str):
+    """'p' = 分區表, 'r' = 一般表, None = 不存在"""
+    return conn.execute(text(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relname = :name AND n.nspname = current_schema()"
+    ), {"name": name}).scalar()
+
+def ensure_partitions(conn, table: str, start: date, end: date) -> List[str]:
+    """
+    確保 [start, end) 之間每個月都有分區。
+    若 DEFAULT 分區中已有該月份的資料，先搬進新表再 ATTACH，避免 CREATE ... PARTITION OF 失敗。
+    """
+    created = []
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+
+    month = _month_start(start)
+    while month < end:
+        next_month = _add_months(month, 1)
+        name = partition_name(table, month)
+        if _relkind(conn, name) is None:
+            conn.execute(text(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+            conn.execute(text(
+                f'WITH moved AS (DELETE FROM "{table}_default" '
+                f"WHERE created_at >= '{_bound(month)}' AND created_at < '{_bound(next_month)}' RETURNING *) "
+                f'INSERT INTO "{name}" SELECT * FROM moved'
+            ))
+            conn.execute(text(
+                f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" '
+                f"FOR VALUES FROM ('{_bound(month)}') TO ('{_bound(next_month)}')"
+            ))
+            created.append(name)
+        month = next_month
+    return created
+
+def _convert_legacy_table(conn, model) -> None:
+    """把舊版 (未分區) 的資料表改建成分區表並搬移資料"""
+    table = partitioned_table(model)
+    name = table.name
+    legacy = f"{name}_legacy"
+    logger.info("Converting table to monthly partitions", extra={"table": name})
+
+    # 舊表、索引與序列的名稱都要讓給新表
+    conn.execute(text(f'ALTER TABLE "{name}" RENAME TO "{legacy}"'))
+    index_names = conn.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :t AND schemaname = current_schema()"
+    ), {"t": legacy}).scalars().all()
+    for index_name in index_names:
+        conn.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_legacy"'))
+    legacy_seq = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": legacy}).scalar()
+    if legacy_seq:
+        seq_name = legacy_seq.split(".")[-1].strip('"')
+        conn.execute(text(f'ALTER SEQUENCE {legacy_seq} RENAME TO "{seq_name}_legacy"'))
+
+    table.create(bind=conn)
+
+    oldest = conn.execute(text(f'SELECT MIN(created_at) FROM "{legacy}"')).scalar()
+    this_month = _month_start(datetime.now(timezone.utc))
+    first_month = _month_start(oldest.astimezone(timezone.utc)) if oldest else this_month
+    ensure_partitions(conn, name, min(first_month, this_month), _add_months(this_month, PARTITION_MONTHS_AHEAD + 1))
+
+    legacy_columns = set(conn.execute(text(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = :t AND table_schema = current_schema()"
+    ), {"t": legacy}).scalars().all())
+    columns = [c.name for c in table.columns if c.name in legacy_columns]
+    select_list = ", ".join(
+        "COALESCE(created_at, now())" if c == "created_at" else f'"{c}"' for c in columns
+    )
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    conn.execute(text(f'INSERT INTO "{name}" ({column_list}) SELECT {select_list} FROM "{legacy}"'))
+    conn.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), COALESCE((SELECT MAX(id) FROM \"{name}\"), 0) + 1, false)"
+    ))
+    conn.execute(text(f'DROP TABLE "{legacy}"'))
+
+def prepare_schema(engine) -> None:
+    """啟動時呼叫：舊表轉為分區表，並確保本月與未來幾個月的分區存在"""
+    if not _is_postgres(engine):
+        return
+    this_month = _month_start(datetime.now(timezone.utc))
+    with engine.begin() as conn:
+        for model in ARCHIVED_FIELDS:
+            name = model.__tablename__
+            if _relkind(conn, name) == "r":
+                _convert_legacy_table(conn, model)
+            ensure_partitions(conn, name, this_month, _add_months(this_month, PARTITION_MONTHS_AHEAD + 1))
+
+def drop_expired_partitions(conn, table: str, cutoff: date) -> List[str]:
+    """刪除整個月份都早於 cutoff 的分區，DEFAULT 分區內的過期資料則逐筆刪除"""
+    dropped = []
+    pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})(\d{{2}})$")
+    partitions = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :t"
+    ), {"t": table}).scalars().all()
+    for name in partitions:
+        match = pattern.match(name)
+        if not match:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if _add_months(month, 1) <= cutoff:
+            conn.execute(text(f'DROP TABLE "{name}"'))
+            dropped.append(name)
+    conn.execute(text(f"DELETE FROM \"{table}_default\" WHERE created_at < '{_bound(cutoff)}'"))
+    conn.execute(text(
+        "DELETE FROM archived_payloads WHERE source_table = :t AND record_created_at < :cutoff"
+    ), {"t": table, "cutoff": _bound(cutoff)})
+    return dropped
+
+# --- 冷資料封存 ---
+
+def archive_cold_rows(db: Session, older_than: datetime) -> Dict[str, int]:
+    """將 older_than 之前的紀錄的大型欄位壓縮移至 archived_payloads，每批次 commit 一次"""
+    codec = _resolve_codec()
+    counts = {}
+    for model, fields in ARCHIVED_FIELDS.items():
+        total = 0
+        while True:
+            rows = db.query(model).filter(
+                model.created_at < older_than,
+                model.archived.isnot(True)
+            ).order_by(model.created_at).limit(ARCHIVE_BATCH_SIZE).all()
+            if not rows:
+                break
+
+            for row in rows:
+                data = {field: getattr(row, field) for field in fields}
+                db.add(models.ArchivedPayload(
+                    source_table=model.__tablename__,
+                    record_id=row.id,
+                    record_created_at=row.created_at,
+                    codec=codec,
+                    payload=compress(json.dumps(data, ensure_ascii=False).encode("utf-8"), codec)
+                ))
+                for field in fields:
+                    setattr(row, field, None)
+                row.archived = True
+            db.commit()
+            total += len(rows)
+
+        counts[model.__tablename__] = total
+        if total:
+            logger.info("Archived cold rows", extra={"table": model.__tablename__, "rows": total, "codec": codec})
+    return counts
+
+def load_archived(db: Session, table: str, record_ids: List[int]) -> Dict[int, dict]:
+    """讀取並解壓指定紀錄的封存欄位，回傳 {record_id: {欄位: 內容}}"""
+    if not record_ids:
+        return {}
+    rows = db.query(
+        models.ArchivedPayload.record_id,
+        models.ArchivedPayload.codec,
+        models.ArchivedPayload.payload
+    ).filter(
+        models.ArchivedPayload.source_table == table,
+        models.ArchivedPayload.record_id.in_(record_ids)
+    ).all()
+    return {r.record_id: json.loads(decompress(r.payload, r.codec)) for r in rows}
+
+def hydrate(db: Session, records):
+    """
+    將已封存紀錄的欄位還原到 ORM 物件上，讓既有的歷史 API 不需知道資料已被封存。
+    只補回目前為 NULL 的欄位 (封存後重新生成的 ai_report 會保留新值)，且不會把物件標記為 dirty。
+    """
+    archived = [r for r in records if r is not None and getattr(r, "archived", False)]
+    if not archived:
+        return records
+
+    by_table = {}
+    for record in archived:
+        by_table.setdefault(record.__tablename__, []).append(record)
+
+    for table, table_records in by_table.items():
+        payloads = load_archived(db, table, [r.id for r in table_records])
+        for record in table_records:
+            for field, value in payloads.get(record.id, {}).items():
+                if getattr(record, field) is None:
+                    set_committed_value(record, field, value)
+    return records
+
+def hydrate_rows(db: Session, table: str, rows: List[dict]) -> List[dict]:
+    """hydrate() 的 dict 版本，給欄位查詢 (非 ORM 物件) 的讀取路徑使用；只還原有被查詢的欄位"""
+    archived = [r for r in rows if r.get("archived")]
+    if not archived:
+        return rows
+
+    payloads = load_archived(db, table, [r["id"] for r in archived])
+    for row in archived:
+        for field, value in payloads.get(row["id"], {}).items():
+            if field in row and row[field] is None:
+                row[field] = value
+    return rows
+
+# --- 排程維護 ---
+
+def run_maintenance(db: Session) -> dict:
+    """每日維護：建立未來分區 -> 封存冷資料 -> 刪除過期分區"""
+    now = datetime.now(timezone.utc)
+    this_month = _month_start(now)
+    is_postgres = _is_postgres(db.get_bind())
+    result = {"partitions_created": [], "archived": {}, "partitions_dropped": []}
+
+    if is_postgres:
+        conn = db.connection()
+        for model in ARCHIVED_FIELDS:
+            result["partitions_created"] += ensure_partitions(
+                conn, model.__tablename__, this_month, _add_months(this_month, PARTITION_MONTHS_AHEAD + 1)
+            )
+        db.commit()
+
+    if ARCHIVE_AFTER_DAYS > 0:
+        result["archived"] = archive_cold_rows(db, now - timedelta(days=ARCHIVE_AFTER_DAYS))
+
+    if RETENTION_MONTHS > 0 and is_postgres:
+        cutoff = _add_months(this_month, -RETENTION_MONTHS)
+        conn = db.connection()
+        for model in ARCHIVED_FIELDS:
+            result["partitions_dropped"] += drop_expired_partitions(conn, model.__tablename__, cutoff)
+        db.commit()
+        if result["partitions_dropped"]:
+            logger.info("Dropped expired partitions", extra={"before": cutoff, "partitions": result["partitions_dropped"]})
+
+    return result
@@ -1,52 +1,89 @@
+import os
 import time
+import logging
 import httpx
 from apscheduler.schedulers.blocking import BlockingScheduler
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Tuple
+from polling import AdaptiveFeed, start_status_server
+import logs
+
+logger = logging.getLogger("scheduler")
 
 # Backend 內部 URL
 BACKEND_BASE_URL = "http://weather-backend:8000"
-UPDATE_WEATHER_URL = f"{BACKEND_BASE_URL}/api/weather?refresh=true"
+PREPARE_WEATHER_URL = f"{BACKEND_BASE_URL}/api/weather/prepare"
+PUBLISH_WEATHER_URL = f"{BACKEND_BASE_URL}/api/weather/publish"
 CHECK_WARNINGS_URL = f"{BACKEND_BASE_URL}/api/cron/check-warnings"
 CHECK_EARTHQUAKES_URL = f"{BACKEND_BASE_URL}/api/cron/check-earthquakes"
+MAINTENANCE_URL = f"{BACKEND_BASE_URL}/api/cron/maintenance"
+READY_URL = f"{BACKEND_BASE_URL}/health/ready"
+
+# 等待 Backend ready 的重試間隔上限 (秒)
+BACKEND_READY_MAX_DELAY = float(os.getenv("BACKEND_READY_MAX_DELAY", "30"))
+
+# 整點預報提前幾分鐘預先生成 (預設 xx:55)
+FORECAST_PREPARE_MINUTE = int(os.getenv("FORECAST_PREPARE_MINUTE", "55"))
+
+# 自適應輪詢設定 (秒)
+EQ_BASE_INTERVAL = float(os.getenv("EQ_BASE_INTERVAL", "60"))
+EQ_HOT_INTERVAL = float(os.getenv("EQ_HOT_INTERVAL", "10"))
+EQ_MAX_INTERVAL = float(os.getenv("EQ_MAX_INTERVAL", "120"))
+EQ_HOT_WINDOW_MINUTES = float(os.getenv("EQ_HOT_WINDOW_MINUTES", "60"))
+EQ_HOT_MIN_MAGNITUDE = float(os.getenv("EQ_HOT_MIN_MAGNITUDE", "5.0")) # 規模達此值才進入密集輪詢 (餘震序列)
+
+WARN_BASE_INTERVAL = float(os.getenv("WARN_BASE_INTERVAL", "600"))
+WARN_HOT_INTERVAL = float(os.getenv("WARN_HOT_INTERVAL", "30"))
+WARN_MAX_INTERVAL = float(os.getenv("WARN_MAX_INTERVAL", "1200"))
+WARN_HOT_WINDOW_MINUTES = float(os.getenv("WARN_HOT_WINDOW_MINUTES", "180"))
+
+# 輪詢狀態 / job profile 的 HTTP 服務沒有驗證，預設只聽本機
+SCHEDULER_STATUS_HOST = os.getenv("SCHEDULER_STATUS_HOST", "127.0.0.1")
+SCHEDULER_STATUS_PORT = int(os.getenv("SCHEDULER_STATUS_PORT", "8001"))
+
+# 以 profiler 執行的 job (all 或以逗號分隔的 job 名稱)，未設定時不 import profiling
+PROFILE_JOBS = os.getenv("PROFILE_JOBS", "")
 
-TTS_API_URL = "http://10.9.0.35:5456/api/stream-speak"
-TTS_ENGINE = "indextts"
+scheduler = BlockingScheduler()
 
-def send_to_tts_api(text):
-    """(Legacy) 直接發送 TTS，現主要由 Backend 處理，但在一般天氣更新時仍保留此邏輯"""
-    print(f"[{datetime.now()}] Sending report to TTS API (Engine: {TTS_ENGINE})...")
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def job_prepare_weather():
+    """整點前預先抓取資料並生成下一個整點的廣播稿"""
+    started = time.perf_counter()
     try:
-        payload = {"engine": TTS_ENGINE, "text": text}
-        with httpx.Client(timeout=30.0) as client:
-            resp = client.post(TTS_API_URL, json=payload)
+        with httpx.Client(timeout=120.0) as client:
+            resp = client.post(PREPARE_WEATHER_URL)
             if resp.status_code == 200:
-                print(f"[{datetime.now()}] TTS API Sent SUCCESS!")
+                logger.info("Forecast draft prepared", extra={
+                    "pipeline": "forecast", "result": resp.json(), "duration_ms": elapsed_ms(started)
+                })
             else:
-                print(f"[{datetime.now()}] TTS API Failed: {resp.status_code} - {resp.text}")
+                logger.error("Forecast draft failed", extra={"pipeline": "forecast", "status_code": resp.status_code})
     except Exception as e:
-        print(f"[{datetime.now()}] TTS API Connection Error: {e}")
+        logger.error("Forecast draft connection error: %s", e, extra={"pipeline": "forecast"})
 
 def job_update_weather():
-    """每小時更新一般天氣"""
-    print(f"[{datetime.now()}] [Job] Triggering hourly weather update...")
+    """每小時整點播報一般天氣 (使用預先生成稿，必要時 Backend 才重新生成)"""
+    started = time.perf_counter()
     try:
         with httpx.Client(timeout=60.0) as client:
-            resp = client.get(UPDATE_WEATHER_URL)
+            resp = client.post(PUBLISH_WEATHER_URL)
             if resp.status_code == 200:
                 data = resp.json()
-                ai_report = data.get("ai_report", "")
-                print(f"[{datetime.now()}] Weather update SUCCESS. AI Report length: {len(ai_report)}")
-                # 一般天氣更新後，仍需在此處呼叫 TTS，因為 Backend 的 GET /api/weather 不會主動播報
-                if ai_report:
-                    send_to_tts_api(ai_report)
+                logger.info("Weather broadcast sent", extra={
+                    "pipeline": "forecast", "source": data.get("source"),
+                    "chars": len(data.get("ai_report") or ""), "duration_ms": elapsed_ms(started)
+                })
             else:
-                print(f"[{datetime.now()}] Weather update failed: {resp.status_code}")
+                logger.error("Weather broadcast failed", extra={"pipeline": "forecast", "status_code": resp.status_code})
     except Exception as e:
-        print(f"[{datetime.now()}] Weather update connection error: {e}")
+        logger.error("Weather broadcast connection error: %s", e, extra={"pipeline": "forecast"})
 
-def job_check_warnings():
-    """每 10 分鐘檢查是否有新特報"""
-    print(f"[{datetime.now()}] [Job] Checking for weather warnings...")
+def job_check_warnings() -> Tuple[int, bool]:
+    """檢查是否有新特報，回傳 (新特報筆數, 是否進入 hot window)；任何新特報都會觸發 hot window"""
+    started = time.perf_counter()
     try:
         with httpx.Client(timeout=60.0) as client:
             # 使用 POST 觸發後端的檢查邏輯
@@ -54,49 +91,159 @@ def job_check_warnings():
             if resp.status_code == 200:
                 result = resp.json()
                 count = result.get("new_warnings_processed", 0)
-                print(f"[{datetime.now()}] Warning check complete. New warnings processed: {count}")
+                logger.info("Warning check complete", extra={
+                    "pipeline": "warnings", "new": count, "duration_ms": elapsed_ms(started)
+                })
+                return count, count > 0
             else:
-                print(f"[{datetime.now()}] Warning check failed: {resp.status_code}")
+                logger.error("Warning check failed", extra={"pipeline": "warnings", "status_code": resp.status_code})
     except Exception as e:
-        print(f"[{datetime.now()}] Warning check connection error: {e}")
+        logger.error("Warning check connection error: %s", e, extra={"pipeline": "warnings"})
+    return 0, False
 
-def job_check_earthquakes():
-    """每 1 分鐘檢查是否有新地震"""
-    print(f"[{datetime.now()}] [Job] Checking for earthquakes...")
+def job_check_earthquakes() -> Tuple[int, bool]:
+    """檢查是否有新地震，回傳 (新地震筆數, 是否有達到 EQ_HOT_MIN_MAGNITUDE 的新地震)"""
+    started = time.perf_counter()
     try:
         with httpx.Client(timeout=60.0) as client:
             resp = client.post(CHECK_EARTHQUAKES_URL)
             if resp.status_code == 200:
                 result = resp.json()
                 count = result.get("new_earthquakes_processed", 0)
-                print(f"[{datetime.now()}] Earthquake check complete. New eqs processed: {count}")
+                max_magnitude = result.get("max_magnitude")
+                logger.info("Earthquake check complete", extra={
+                    "pipeline": "earthquakes", "new": count, "max_magnitude": max_magnitude,
+                    "duration_ms": elapsed_ms(started)
+                })
+                return count, count > 0 and max_magnitude is not None and max_magnitude >= EQ_HOT_MIN_MAGNITUDE
+            else:
+                logger.error("Earthquake check failed", extra={"pipeline": "earthquakes", "status_code": resp.status_code})
+    except Exception as e:
+        logger.error("Earthquake check connection error: %s", e, extra={"pipeline": "earthquakes"})
+    return 0, False
+
+def job_maintenance():
+    """每日凌晨執行資料保存維護 (分區 / 封存 / 過期刪除)"""
+    started = time.perf_counter()
+    try:
+        with httpx.Client(timeout=600.0) as client:
+            resp = client.post(MAINTENANCE_URL)
+            if resp.status_code == 200:
+                logger.info("Maintenance complete", extra={
+                    "pipeline": "maintenance", "result": resp.json(), "duration_ms": elapsed_ms(started)
+                })
             else:
-                print(f"[{datetime.now()}] Earthquake check failed: {resp.status_code}")
+                logger.error("Maintenance failed", extra={"pipeline": "maintenance", "status_code": resp.status_code})
     except Exception as e:
-        print(f"[{datetime.now()}] Earthquake check connection error: {e}")
+        logger.error("Maintenance connection error: %s", e, extra={"pipeline": "maintenance"})
+
+# --- 自適應輪詢 ---
+
+FEEDS = {
+    "earthquakes": AdaptiveFeed(
+        "earthquakes", EQ_BASE_INTERVAL, EQ_HOT_INTERVAL, EQ_MAX_INTERVAL, EQ_HOT_WINDOW_MINUTES * 60
+    ),
+    "warnings": AdaptiveFeed(
+        "warnings", WARN_BASE_INTERVAL, WARN_HOT_INTERVAL, WARN_MAX_INTERVAL, WARN_HOT_WINDOW_MINUTES * 60
+    ),
+}
+FEED_JOBS = {
+    "earthquakes": job_check_earthquakes,
+    "warnings": job_check_warnings,
+}
+
+def add_feed_job(feed: AdaptiveFeed):
+    """
+    每個 feed 一個常駐的 interval job，立即執行第一次；之後由 run_feed 以 schedule_feed 移動下一次的時間。
+    interval (max_interval) 只是保底：run_feed 意外中斷時 job 仍會繼續執行。
+    misfire_grace_time=None + coalesce：排程器停頓、主機休眠後補跑一次，不會因錯過時間而被刪除
+    """
+    feed.next_run = datetime.now()
+    scheduler.add_job(
+        run_feed, 'interval', seconds=feed.max_interval, next_run_time=feed.next_run, args=[feed],
+        id=feed.name, replace_existing=True, misfire_grace_time=None, coalesce=True
+    )
+
+def schedule_feed(feed: AdaptiveFeed, delay: float):
+    feed.next_run = datetime.now() + timedelta(seconds=delay)
+    scheduler.modify_job(feed.name, next_run_time=feed.next_run)
+
+def run_feed(feed: AdaptiveFeed):
+    """執行一次輪詢，並依結果排定下一次 (發生例外時維持目前的間隔)"""
+    delay = feed.next_delay()
+    try:
+        previous_mode = feed.mode
+        new_records, hot = FEED_JOBS[feed.name]()
+        feed.record(new_records, hot)
+        if feed.mode != previous_mode:
+            logger.info("Polling cadence changed", extra={
+                "pipeline": feed.name, "from": previous_mode, "to": feed.mode, "interval_s": round(feed.interval)
+            })
+        delay = feed.next_delay()
+    finally:
+        schedule_feed(feed, delay)
+
+def enable_job_profiling():
+    """以 profiler 包裝 PROFILE_JOBS 指定的 job_*，回傳保留最慢紀錄的 ProfileStore"""
+    import profiling
+    if not profiling.available():
+        logger.warning("PROFILE_JOBS is set but pyinstrument is not installed, job profiling disabled")
+        return None
+
+    targets = profiling.job_profiling_targets()
+    store = profiling.ProfileStore()
+    wrapped = []
+    for name, func in list(globals().items()):
+        if name.startswith("job_") and callable(func) and ("all" in targets or name in targets):
+            globals()[name] = profiling.profile_job(func, store)
+            wrapped.append(name)
+    # run_feed 經由 FEED_JOBS 呼叫，需一併換成包裝後的函式
+    for feed_name, func in FEED_JOBS.items():
+        FEED_JOBS[feed_name] = globals()[func.__name__]
+    logger.info("Job profiling enabled", extra={"jobs": wrapped})
+    return store
+
+def wait_for_backend():
+    """輪詢 /health/ready 直到 Backend 完成啟動 (資料庫、migration 就緒)，間隔以指數遞增"""
+    started = time.monotonic()
+    delay = 0.5
+    while True:
+        try:
+            resp = httpx.get(READY_URL, timeout=5.0)
+            if resp.status_code == 200:
+                logger.info("Backend ready", extra={"duration_ms": round((time.monotonic() - started) * 1000)})
+                return
+            detail = resp.json().get("startup", {}).get("status", resp.status_code)
+        except (httpx.HTTPError, ValueError) as e:
+            detail = str(e) or type(e).__name__
+        logger.info("Backend not ready (%s), retrying in %.1fs", detail, delay)
+        time.sleep(delay)
+        delay = min(delay * 2, BACKEND_READY_MAX_DELAY)
 
 if __name__ == "__main__":
-    print("Starting Weather Scheduler...")
-    
-    scheduler = BlockingScheduler()
+    logs.setup("scheduler")
+    logger.info("Starting Weather Scheduler")
+    job_profiles = enable_job_profiling() if PROFILE_JOBS else None
     
     # 優先順序調整：
-    # 1. 每 1 分鐘執行地震檢查 (最緊急)
-    scheduler.add_job(job_check_earthquakes, 'cron', minute='*')
-
-    # 2. 每 10 分鐘執行特報檢查 (次緊急)
-    scheduler.add_job(job_check_warnings, 'cron', minute='*/10')
+    # 1. 地震檢查 (最緊急) 與 2. 特報檢查 (次緊急) 皆為自適應輪詢，
+    #    平時分別約每 1 分鐘 / 10 分鐘，事件發生後密集輪詢，長時間無事件則逐步放慢
 
-    # 3. 每小時整點執行一般天氣預報 (例行性)
+    # 3. 每小時整點執行一般天氣預報 (例行性)，並在整點前先生成廣播稿
+    scheduler.add_job(job_prepare_weather, 'cron', minute=FORECAST_PREPARE_MINUTE)
     scheduler.add_job(job_update_weather, 'cron', minute=0)
+
+    # 4. 每日凌晨資料保存維護 (避開整點)
+    scheduler.add_job(job_maintenance, 'cron', hour=3, minute=30)
     
     # 程式啟動時，先等待 Backend Ready，然後立即執行一次檢查
-    print("Waiting for backend to be ready...")
-    time.sleep(10) # 等待 Backend 與 DB 連線建立
+    logger.info("Waiting for backend to be ready")
+    wait_for_backend()
     
-    # 立即執行一次特報檢查
-    job_check_warnings()
-    job_check_earthquakes()
+    # 立即執行一次檢查，之後由各 feed 自行排定下一次
+    for feed in FEEDS.values():
+        add_feed_job(feed)
+    start_status_server(SCHEDULER_STATUS_HOST, SCHEDULER_STATUS_PORT, FEEDS, job_profiles)
     
     try:
         scheduler.start()
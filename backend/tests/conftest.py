@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# backend 的模組皆為平面結構 (import main / polling / cwa)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def sqlite_engine(tmp_path, monkeypatch):
+    """套用全部 migration 的 SQLite 資料庫；如同使用 SQLite 部署，本機為單機 leader、不送 pg_notify"""
+    from sqlalchemy import create_engine
+    import coordination
+    import migrations
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'weather.db'}")
+    monkeypatch.setattr(migrations, "engine", engine)
+    monkeypatch.setattr(coordination, "_coordination_enabled", lambda: False)
+    monkeypatch.setattr(coordination, "elector", coordination.LeaderElector())
+    migrations.run_migrations()
+    yield engine
+    engine.dispose()
@@ -0,0 +1,135 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+
+import cwa
+from cwa import TokenBucket
+
+@pytest.fixture
+def gateway(monkeypatch, tmp_path):
+    """隔離 cwa 模組的狀態，CWA 回應由 upstream["handler"] 決定"""
+    monkeypatch.setattr(cwa, "CWA_API_KEY", "test-key")
+    monkeypatch.setattr(cwa, "CWA_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cwa, "CWA_MAX_WAIT", 0.05)
+    monkeypatch.setattr(cwa, "bucket", TokenBucket(60, capacity=10, reserve=2))
+    monkeypatch.setitem(cwa.DATASETS[cwa.FORECAST], "slow_seconds", 0.1)
+    for name in ("_last_good", "_inflight", "_stats", "_usage"):
+        monkeypatch.setattr(cwa, name, {})
+    monkeypatch.setattr(cwa, "_disk_checked", set())
+
+    upstream = {"calls": 0, "delay": 0.0, "status": 200}
+
+    async def handler(request):
+        upstream["calls"] += 1
+        await asyncio.sleep(upstream["delay"])
+        return httpx.Response(upstream["status"], json={"success": "true", "records": {"n": upstream["calls"]}})
+
+    def run(coro_fn):
+        async def main():
+            cwa._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            try:
+                return await coro_fn()
+            finally:
+                await cwa.close()
+        return asyncio.run(main())
+
+    upstream["run"] = run
+    return upstream
+
+# --- TokenBucket ---
+
+def test_bucket_keeps_reserve_for_reserved_callers():
+    bucket = TokenBucket(60, capacity=5, reserve=2)
+    assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_acquire() > 0
+    assert bucket.try_acquire(reserved=True) == 0
+    assert bucket.try_acquire(reserved=True) == 0
+    assert bucket.try_acquire(reserved=True) > 0
+
+def test_bucket_wait_time_and_refill():
+    bucket = TokenBucket(60, capacity=5, reserve=0) # 每秒補 1 個
+    bucket.tokens = 0
+    bucket._updated = time.monotonic()
+    assert 0.9 < bucket.try_acquire() <= 1.0
+
+    bucket._updated -= 2
+    assert bucket.try_acquire() == 0
+    assert 0.9 < bucket.snapshot()["tokens"] < 1.1
+
+def test_bucket_refill_is_capped():
+    bucket = TokenBucket(60, capacity=5, reserve=0)
+    bucket._updated -= 3600
+    assert bucket.snapshot()["tokens"] == 5
+
+def test_reserve_always_leaves_one_token_for_normal_callers():
+    assert TokenBucket(60, capacity=3, reserve=10).reserve == 2
+
+# --- fetch ---
+
+def test_concurrent_requests_are_coalesced(gateway):
+    results = gateway["run"](lambda: asyncio.gather(*[cwa.fetch(cwa.WARNINGS) for _ in range(5)]))
+    assert gateway["calls"] == 1
+    assert all(r == results[0] for r in results)
+    assert cwa.metrics()["datasets"][cwa.WARNINGS]["coalesced"] == 4
+
+def test_no_last_good_raises_on_error(gateway):
+    gateway["status"] = 500
+    with pytest.raises(cwa.CWAError):
+        gateway["run"](lambda: cwa.fetch(cwa.EARTHQUAKES))
+    assert cwa.metrics()["datasets"][cwa.EARTHQUAKES]["errors"] == 1
+
+def test_error_serves_last_good(gateway):
+    async def scenario():
+        first = await cwa.fetch(cwa.EARTHQUAKES)
+        gateway["status"] = 500
+        return first, await cwa.fetch(cwa.EARTHQUAKES)
+    first, second = gateway["run"](scenario)
+    assert second == first
+    assert cwa.metrics()["datasets"][cwa.EARTHQUAKES]["stale_served"] == 1
+
+def test_slow_forecast_serves_stale_and_revalidates(gateway):
+    async def scenario():
+        await cwa.fetch(cwa.FORECAST)
+        cwa._last_good[cwa._cache_key(cwa.FORECAST, None)]["fetched_at"] -= 3600 # 超過 max_age
+        gateway["delay"] = 0.3
+        stale = await cwa.fetch(cwa.FORECAST)
+        await asyncio.sleep(0.4)
+        return stale, cwa._last_good[cwa._cache_key(cwa.FORECAST, None)]["data"]
+    stale, revalidated = gateway["run"](scenario)
+    assert stale["records"]["n"] == 1
+    assert revalidated["records"]["n"] == 2
+
+def test_slow_earthquakes_wait_for_fresh_data(gateway):
+    async def scenario():
+        await cwa.fetch(cwa.EARTHQUAKES)
+        gateway["delay"] = 0.3 # 超過預報的 slow_seconds，但地震不回傳舊快照
+        return await cwa.fetch(cwa.EARTHQUAKES)
+    assert gateway["run"](scenario)["records"]["n"] == 2
+    assert cwa.metrics()["datasets"][cwa.EARTHQUAKES]["stale_served"] == 0
+
+def test_fresh_forecast_is_served_from_cache(gateway):
+    async def scenario():
+        await cwa.fetch(cwa.FORECAST)
+        return await cwa.fetch(cwa.FORECAST)
+    gateway["run"](scenario)
+    assert gateway["calls"] == 1
+    assert cwa.metrics()["datasets"][cwa.FORECAST]["fresh_hits"] == 1
+
+def test_throttled_normal_dataset_cannot_use_earthquake_reserve(gateway):
+    async def scenario():
+        cwa.bucket.tokens = 2.5 # 只剩保留給地震的額度
+        cwa.bucket._updated = time.monotonic()
+        with pytest.raises(cwa.CWAError):
+            await cwa.fetch(cwa.WARNINGS)
+        return await cwa.fetch(cwa.EARTHQUAKES)
+    assert gateway["run"](scenario)["records"]["n"] == 1
+    assert cwa.metrics()["datasets"][cwa.WARNINGS]["throttled"] == 1
+
+def test_last_good_survives_restart_via_disk(gateway):
+    gateway["run"](lambda: cwa.fetch(cwa.WARNINGS))
+    cwa._last_good.clear()
+    cwa._disk_checked.clear()
+    gateway["status"] = 500
+    assert gateway["run"](lambda: cwa.fetch(cwa.WARNINGS))["records"]["n"] == 1
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+import main
+import models
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "eq_api_sample.json")
+
+@pytest.fixture
+def Session(sqlite_engine, monkeypatch):
+    """以範例資料的前兩筆地震取代 CWA，AI / TTS 改為假的 (TTS 稍微延遲，讓兩次檢查重疊)"""
+    with open(SAMPLE, encoding="utf-8") as f:
+        data = json.load(f)
+    data["records"]["Earthquake"] = data["records"]["Earthquake"][:2]
+    broadcasts = []
+
+    async def fetch(dataset, params=None):
+        return data
+
+    async def generate_ai_text(system_prompt, user_prompt):
+        return "地震廣播稿"
+
+    async def send_to_tts_api(text):
+        broadcasts.append(text)
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(main, "CWA_API_KEY", "test-key")
+    monkeypatch.setattr(main.cwa, "fetch", fetch)
+    monkeypatch.setattr(main, "generate_ai_text", generate_ai_text)
+    monkeypatch.setattr(main, "send_to_tts_api", send_to_tts_api)
+    return sessionmaker(bind=sqlite_engine)
+
+def check(Session):
+    db = Session()
+    try:
+        return asyncio.run(main.check_and_process_earthquakes(db=db))
+    finally:
+        db.close()
+
+def test_new_earthquakes_are_saved_once(Session):
+    assert check(Session)["new_earthquakes_processed"] == 2
+    assert check(Session)["new_earthquakes_processed"] == 0
+
+    db = Session()
+    assert db.query(models.EarthquakeAlert).count() == 2
+    assert db.query(models.EarthquakeNumber).count() == 2
+    db.close()
+
+def test_overlapping_checks_do_not_store_duplicates(Session):
+    async def overlapping():
+        first, second = Session(), Session()
+        try:
+            return await asyncio.gather(
+                main.check_and_process_earthquakes(db=first), main.check_and_process_earthquakes(db=second)
+            )
+        finally:
+            first.close()
+            second.close()
+
+    results = asyncio.run(overlapping())
+    assert sorted(r["new_earthquakes_processed"] for r in results) == [0, 2]
+
+    db = Session()
+    assert db.query(models.EarthquakeAlert).count() == 2
+    db.close()
+
+def test_demoted_leader_stops_before_broadcasting(Session, monkeypatch):
+    broadcasts = []
+
+    async def generate_ai_text(system_prompt, user_prompt):
+        # AI 生成途中租約過期，由其他 replica 接手
+        main.coordination.elector._standalone = False
+        main.coordination.elector._is_leader = False
+        return "地震廣播稿"
+
+    async def send_to_tts_api(text):
+        broadcasts.append(text)
+
+    monkeypatch.setattr(main, "generate_ai_text", generate_ai_text)
+    monkeypatch.setattr(main, "send_to_tts_api", send_to_tts_api)
+    with pytest.raises(main.coordination.NotLeaderError):
+        check(Session)
+
+    assert broadcasts == []
+    db = Session()
+    assert db.query(models.EarthquakeAlert).count() == 0
+    db.close()
@@ -0,0 +1,103 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+import main
+import models
+from main import forecast_changed, DRAFT_POP_DELTA, DRAFT_TEMP_DELTA
+
+def city(name="臺北市", wx="多雲", pop="20", minT="20", maxT="28"):
+    return {"name": name, "wx": wx, "pop": pop, "minT": minT, "maxT": maxT}
+
+def test_unchanged_forecast_keeps_draft():
+    assert forecast_changed([city()], [city()]) is None
+
+def test_small_changes_below_threshold_keep_draft():
+    latest = city(pop=str(20 + DRAFT_POP_DELTA - 1), maxT=str(28 + DRAFT_TEMP_DELTA - 1))
+    assert forecast_changed([city()], [latest]) is None
+
+def test_weather_phenomenon_change():
+    assert "天氣現象" in forecast_changed([city()], [city(wx="短暫陣雨")])
+
+def test_pop_change_at_threshold():
+    assert "pop" in forecast_changed([city()], [city(pop=str(20 + DRAFT_POP_DELTA))])
+
+def test_temperature_drop_at_threshold():
+    assert "minT" in forecast_changed([city()], [city(minT=str(20 - DRAFT_TEMP_DELTA))])
+
+def test_city_list_change():
+    assert forecast_changed([city()], [city(), city(name="新北市")]) == "縣市清單不同"
+
+def test_non_numeric_values_compare_as_text():
+    assert forecast_changed([city(pop="-")], [city(pop="-")]) is None
+    assert "pop" in forecast_changed([city(pop="-")], [city(pop="30")])
+
+# --- 整點播報 ---
+
+@pytest.fixture
+def publish(sqlite_engine, monkeypatch):
+    """
+    以 SQLite 執行 publish_hourly_forecast：CWA 回傳降雨機率大幅改變的資料 (需要重新生成)，
+    AI 生成失敗；回傳 (執行函式, TTS 播出的內容, Session)
+    """
+    broadcasts = []
+
+    async def fetch_cities_forecast():
+        return [main.CityWeather(**city(pop="90"))]
+
+    async def fetch_overview():
+        return "最新概況"
+
+    async def complete(system_prompt, user_content, client=None):
+        raise RuntimeError("provider error")
+
+    async def send_to_tts_api(text):
+        broadcasts.append(text)
+
+    monkeypatch.setattr(main, "fetch_cities_forecast", fetch_cities_forecast)
+    monkeypatch.setattr(main, "fetch_overview", fetch_overview)
+    monkeypatch.setattr(main.llm, "complete", complete)
+    monkeypatch.setattr(main, "send_to_tts_api", send_to_tts_api)
+    Session = sessionmaker(bind=sqlite_engine)
+
+    def run():
+        db = Session()
+        try:
+            return asyncio.run(main.publish_hourly_forecast(db=db))
+        finally:
+            db.close()
+    return run, broadcasts, Session
+
+def add_draft(Session):
+    db = Session()
+    target_hour = datetime.now().astimezone().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    db.add(models.ForecastDraft(
+        target_hour=target_hour, overview="草稿概況", cities_data=json.dumps([city()], ensure_ascii=False), ai_report="草稿廣播稿"
+    ))
+    db.commit()
+    db.close()
+
+def test_failed_regeneration_publishes_draft(publish):
+    run, broadcasts, Session = publish
+    add_draft(Session)
+
+    result = run()
+    assert result["source"] == "draft_fallback"
+    assert broadcasts == ["草稿廣播稿"]
+
+    db = Session()
+    assert [f.ai_report for f in db.query(models.WeatherForecast)] == ["草稿廣播稿"]
+    assert db.query(models.ForecastDraft).one().published_at is not None
+    db.close()
+
+def test_failed_generation_without_draft_skips_broadcast(publish):
+    run, broadcasts, Session = publish
+
+    assert run()["status"] == "error"
+    assert broadcasts == []
+    db = Session()
+    assert db.query(models.WeatherForecast).count() == 0
+    db.close()
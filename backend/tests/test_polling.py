@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+import polling
+from polling import AdaptiveFeed, POLL_QUIET_RUNS
+
+def make_feed():
+    return AdaptiveFeed("earthquakes", base_interval=60, hot_interval=10, max_interval=120, hot_window=3600)
+
+def quiet(feed, runs):
+    for _ in range(runs):
+        feed.record(0)
+
+def test_quiet_runs_back_off_up_to_max_interval():
+    feed = make_feed()
+    quiet(feed, POLL_QUIET_RUNS)
+    assert feed.mode == "normal" and feed.interval == 60
+
+    feed.record(0)
+    assert feed.mode == "backoff" and feed.interval == 60 * polling.POLL_BACKOFF_FACTOR
+
+    quiet(feed, 20)
+    assert feed.interval == 120
+
+def test_new_records_below_hot_threshold_reset_backoff():
+    feed = make_feed()
+    quiet(feed, POLL_QUIET_RUNS + 5)
+    assert feed.mode == "backoff"
+
+    feed.record(1, hot=False)
+    assert feed.mode == "normal"
+    assert feed.interval == 60
+    assert feed.quiet_runs == 0
+    assert feed.hot_until is None
+
+def test_hot_trigger_switches_to_hot_interval():
+    feed = make_feed()
+    feed.record(1, hot=True)
+    assert feed.mode == "hot" and feed.interval == 10
+
+    # hot window 內沒有新事件仍維持短間隔
+    quiet(feed, POLL_QUIET_RUNS + 5)
+    assert feed.mode == "hot"
+
+def test_hot_window_expiry_returns_to_base_interval():
+    feed = make_feed()
+    feed.record(1, hot=True)
+    feed.hot_until = datetime.now() - timedelta(seconds=1)
+    feed.record(0)
+    assert feed.mode == "normal"
+    assert feed.interval == 60
+    assert feed.hot_until is None
+
+def test_next_delay_applies_jitter():
+    feed = make_feed()
+    for _ in range(100):
+        assert 60 * (1 - polling.POLL_JITTER) <= feed.next_delay() <= 60 * (1 + polling.POLL_JITTER)
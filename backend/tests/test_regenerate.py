@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import models
+import regenerate
+
+class NoLimit:
+    async def acquire(self):
+        pass
+
+@pytest.fixture
+def failing():
+    """AI 生成會失敗的特報 id"""
+    return {2}
+
+@pytest.fixture
+def Session(sqlite_engine, monkeypatch, failing):
+    """三筆特報，AI 生成改為假的 (failing 中的紀錄會失敗)"""
+    Session = sessionmaker(bind=sqlite_engine)
+    db = Session()
+    db.add_all([
+        models.WeatherWarning(title=f"特報 {i}", issue_time=f"2026-01-0{i}", content="內容", affected_areas="臺北市", ai_report="舊稿")
+        for i in (1, 2, 3)
+    ])
+    db.commit()
+    db.close()
+
+    async def complete(system_prompt, user_prompt, client=None):
+        if any(f"特報 {i}" in user_prompt for i in failing):
+            raise RuntimeError("provider error")
+        return "新稿"
+
+    monkeypatch.setattr(regenerate, "SessionLocal", Session)
+    monkeypatch.setattr(regenerate, "REGEN_BATCH_SIZE", 2)
+    monkeypatch.setattr(regenerate, "REGEN_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(regenerate.llm, "rate_limiter", lambda: NoLimit())
+    monkeypatch.setattr(regenerate.llm, "complete", complete)
+    return Session
+
+def create_job(Session) -> int:
+    db = Session()
+    job = models.RegenerationJob(record_type="warnings", status="pending", processed=0, failed=0, total=3)
+    db.add(job)
+    db.commit()
+    job_id = job.id
+    db.close()
+    return job_id
+
+def reports(Session) -> dict:
+    db = Session()
+    try:
+        return {w.id: w.ai_report for w in db.query(models.WeatherWarning)}
+    finally:
+        db.close()
+
+def test_failed_records_are_retried_on_resume(Session, failing):
+    job_id = create_job(Session)
+    asyncio.run(regenerate.run_job(job_id))
+
+    db = Session()
+    job = db.get(models.RegenerationJob, job_id)
+    assert (job.status, job.processed, regenerate._failed_ids(job)) == ("completed_with_errors", 3, [2])
+    db.close()
+    assert reports(Session) == {1: "新稿", 2: "舊稿", 3: "新稿"}
+
+    failing.clear()
+    asyncio.run(regenerate.run_job(job_id))
+    db = Session()
+    job = db.get(models.RegenerationJob, job_id)
+    assert (job.status, job.failed) == ("completed", 0)
+    db.close()
+    assert reports(Session)[2] == "新稿"
+
+def test_bulk_update_does_not_set_created_at(Session, sqlite_engine):
+    updates = []
+
+    @event.listens_for(sqlite_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE weather_warnings"):
+            updates.append(statement)
+
+    asyncio.run(regenerate.run_job(create_job(Session)))
+    assert updates
+    assert all("created_at" not in statement for statement in updates)
+
+def test_demoted_leader_leaves_job_running_for_the_new_leader(Session, monkeypatch):
+    async def complete(system_prompt, user_prompt, client=None):
+        regenerate.coordination.elector._standalone = False
+        regenerate.coordination.elector._is_leader = False
+        return "新稿"
+
+    monkeypatch.setattr(regenerate.llm, "complete", complete)
+    job_id = create_job(Session)
+    asyncio.run(regenerate.run_job(job_id))
+
+    db = Session()
+    job = db.get(models.RegenerationJob, job_id)
+    assert (job.status, job.processed) == ("running", 0)
+    db.close()
+    assert set(reports(Session).values()) == {"舊稿"}
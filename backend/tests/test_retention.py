@@ -0,0 +1,80 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+import export
+import main
+import models
+import retention
+
+OLD = datetime.now(timezone.utc) - timedelta(days=retention.ARCHIVE_AFTER_DAYS + 30)
+
+@pytest.fixture
+def db(sqlite_engine, monkeypatch):
+    """SQLite 上的歷史資料表，各放一筆已超過封存期限的紀錄並執行封存"""
+    Session = sessionmaker(bind=sqlite_engine)
+    monkeypatch.setattr(export, "SessionLocal", Session)
+
+    session = Session()
+    session.add_all([
+        models.WeatherWarning(
+            dataset_id="W-C0033-002", issue_time="2026-01-01 10:00:00", title="陸上強風特報",
+            content="東北季風增強", affected_areas="基隆市, 臺北市", ai_report="特報廣播稿", created_at=OLD
+        ),
+        models.EarthquakeAlert(
+            earthquake_no=115003, report_type="地震報告", origin_time="2026-01-12 21:31:49",
+            location="宜蘭縣政府東方 24.9 公里", magnitude="5.3", depth="70.3", content="宜蘭外海地震",
+            intensity_summary="宜蘭縣4級", ai_report="地震廣播稿", created_at=OLD
+        ),
+        models.WeatherForecast(
+            overview="全台多雲", cities_data='[{"name": "臺北市"}]', ai_report="整點預報廣播稿", created_at=OLD
+        ),
+    ])
+    session.commit()
+
+    counts = retention.archive_cold_rows(session, datetime.now(timezone.utc) - timedelta(days=retention.ARCHIVE_AFTER_DAYS))
+    assert counts == {"weather_warnings": 1, "earthquake_alerts": 1, "weather_forecasts": 1}
+    session.expire_all()
+    yield session
+    session.close()
+
+def body(response) -> list:
+    return json.loads(response.body)
+
+def test_archive_moves_large_fields_out_of_the_row(db):
+    eq = db.query(models.EarthquakeAlert).one()
+    assert eq.archived
+    assert eq.intensity_summary is None and eq.ai_report is None
+    assert eq.content == "宜蘭外海地震" # 搜尋欄位不封存
+    assert db.query(models.ArchivedPayload).count() == 3
+
+def test_list_endpoints_hydrate_archived_rows(db):
+    warnings = body(main.get_warnings(db=db))
+    assert warnings[0]["ai_report"] == "特報廣播稿"
+
+    eqs = body(main.get_earthquakes(db=db))
+    assert eqs[0]["intensity_summary"] == "宜蘭縣4級"
+    assert eqs[0]["ai_report"] == "地震廣播稿"
+    assert "archived" not in eqs[0]
+
+def test_search_finds_archived_rows(db):
+    assert [w["ai_report"] for w in body(main.get_warnings(q="東北季風", db=db))] == ["特報廣播稿"]
+    assert [e["earthquake_no"] for e in body(main.get_earthquakes(q="宜蘭外海", db=db))] == [115003]
+    assert [f["ai_report"] for f in body(main.get_forecasts(q="整點預報", db=db))] == ["整點預報廣播稿"]
+
+def test_export_hydrates_archived_rows(db):
+    rows = [row for batch in export._iter_batches(models.WeatherForecast, None, None) for row in batch]
+    assert rows[0]["cities_data"] == '[{"name": "臺北市"}]'
+    assert "archived" not in rows[0]
+
+def test_hydrate_keeps_values_written_after_archival(db):
+    eq = db.query(models.EarthquakeAlert).one()
+    eq.ai_report = "重新生成的廣播稿"
+    db.commit()
+
+    retention.hydrate(db, [eq])
+    assert eq.ai_report == "重新生成的廣播稿"
+    assert eq.intensity_summary == "宜蘭縣4級"
+    assert not db.dirty
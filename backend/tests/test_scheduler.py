@@ -0,0 +1,55 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from apscheduler.schedulers.background import BackgroundScheduler
+
+import polling
+import scheduler
+from polling import AdaptiveFeed
+
+@pytest.fixture
+def feed(monkeypatch):
+    """以 BackgroundScheduler 取代 BlockingScheduler，檢查 job 以假的函式取代"""
+    background = BackgroundScheduler()
+    monkeypatch.setattr(scheduler, "scheduler", background)
+    monkeypatch.setattr(polling, "POLL_JITTER", 0)
+    feed = AdaptiveFeed("earthquakes", base_interval=60, hot_interval=10, max_interval=120, hot_window=3600)
+    yield feed
+    if background.running:
+        background.shutdown(wait=True)
+
+def run_once(monkeypatch, feed, job) -> datetime:
+    """啟動排程器，等 feed 執行一次並重新排定後回傳下一次執行時間"""
+    done = threading.Event()
+    monkeypatch.setitem(scheduler.FEED_JOBS, feed.name, job)
+    original = scheduler.schedule_feed
+
+    def schedule_feed(feed, delay):
+        original(feed, delay)
+        done.set()
+    monkeypatch.setattr(scheduler, "schedule_feed", schedule_feed)
+
+    scheduler.scheduler.start()
+    assert done.wait(5)
+    job = scheduler.scheduler.get_job(feed.name)
+    assert job is not None
+    return job.next_run_time.replace(tzinfo=None)
+
+def test_missed_run_still_runs_and_stays_scheduled(monkeypatch, feed):
+    scheduler.add_feed_job(feed)
+    # 排程器停頓 (例如主機休眠) 40 秒後才處理
+    scheduler.scheduler.modify_job(feed.name, next_run_time=datetime.now() - timedelta(seconds=40))
+
+    calls = []
+    next_run = run_once(monkeypatch, feed, lambda: calls.append(1) or (0, False))
+    assert calls == [1]
+    assert abs((next_run - datetime.now()).total_seconds() - 60) < 5
+
+def test_failing_check_keeps_the_feed_scheduled(monkeypatch, feed):
+    def broken():
+        raise RuntimeError("unexpected")
+
+    scheduler.add_feed_job(feed)
+    next_run = run_once(monkeypatch, feed, broken)
+    assert abs((next_run - datetime.now()).total_seconds() - 60) < 5
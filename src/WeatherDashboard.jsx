@@ -11,6 +11,7 @@ export default function App() {
   const [dbData, setDbData] = useState({ forecasts: [], warnings: [], earthquakes: [] });
   const [dbLoading, setDbLoading] = useState(false);
   const [systemConfig, setSystemConfig] = useState({ ai_provider: '', ai_model: 'Loading...' });
+  const [dashboard, setDashboard] = useState(null);
 
   // Pagination & Search State
   const [page, setPage] = useState(0);
@@ -30,14 +31,17 @@ export default function App() {
     setModalOpen(true);
   };
 
-  // Fetch Config
-  const fetchConfig = async () => {
+  // Dashboard Fetch: config + latest forecast + first page of each history in one request
+  // cache: 'no-cache' lets the browser revalidate with the ETag (304 when nothing changed)
+  const fetchDashboard = async () => {
     try {
-      const res = await fetch(`${BACKEND_URL}/api/config`);
+      const res = await fetch(`${BACKEND_URL}/api/dashboard?limit=${LIMIT}`, { cache: 'no-cache' });
       const data = await res.json();
-      setSystemConfig(data);
+      setSystemConfig(data.config);
+      if (data.weather) setCurrentWeather(data.weather);
+      setDashboard(data);
     } catch (e) {
-      console.error("Fetch config error:", e);
+      console.error("Fetch dashboard error:", e);
     }
   };
 
@@ -104,15 +108,14 @@ export default function App() {
   };
 
   useEffect(() => {
-    fetchConfig();
-    fetchLiveWeather();
+    fetchDashboard();
   }, []);
 
   useEffect(() => {
     if (activeTab === 'db') {
-      fetchDbData();
+      fetchDashboard();
     }
-  }, [activeTab, page]); // Re-fetch when tab or page changes
+  }, [activeTab]); // Revalidate when switching to the history tab
 
   // Trigger search when enter key is pressed or search button clicked
   const handleSearch = () => {
@@ -258,6 +261,7 @@ export default function App() {
               icon={CloudSun}
               iconColor="text-blue-500"
               apiUrl="/api/forecasts"
+              initialData={dashboard?.forecasts}
               renderRow={(f) => (
                 <tr key={f.id} className="hover:bg-slate-50">
                   <td className="px-4 py-3 font-mono text-slate-400">#{f.id}</td>
@@ -285,6 +289,7 @@ export default function App() {
               icon={AlertTriangle}
               iconColor="text-orange-500"
               apiUrl="/api/warnings"
+              initialData={dashboard?.warnings}
               renderRow={(w) => (
                 <tr key={w.id} className="hover:bg-slate-50">
                   <td className="px-4 py-3 font-mono text-slate-400">#{w.id}</td>
@@ -327,6 +332,7 @@ export default function App() {
               icon={Activity}
               iconColor="text-red-500"
               apiUrl="/api/earthquakes"
+              initialData={dashboard?.earthquakes}
               renderRow={(eq) => (
                 <tr key={eq.id} className="hover:bg-slate-50">
                   <td className="px-4 py-3 font-mono text-slate-400">#{eq.earthquake_no}</td>
@@ -417,7 +423,7 @@ export default function App() {
 }
 
 // Reusable DataTable Component
-function DataTable({ title, icon: Icon, iconColor, apiUrl, renderRow, headers }) {
+function DataTable({ title, icon: Icon, iconColor, apiUrl, initialData, renderRow, headers }) {
   const [data, setData] = useState([]);
   const [loading, setLoading] = useState(false);
   const [page, setPage] = useState(0);
@@ -443,8 +449,13 @@ function DataTable({ title, icon: Icon, iconColor, apiUrl, renderRow, headers })
   };
 
   useEffect(() => {
+    // First page comes from /api/dashboard; other pages and searches fetch on their own
+    if (page === 0 && !searchQuery && initialData) {
+      setData(initialData);
+      return;
+    }
     fetchData();
-  }, [page]); // Re-fetch on page change
+  }, [page, initialData]); // Re-fetch on page change
 
   const handleSearch = () => {
     setPage(0); // Reset to page 0 on search